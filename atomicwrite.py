@@ -0,0 +1,23 @@
+"""
+Writes files so a power loss leaves either the old or the new content behind, never a partial file.
+The content is written to a temporary file and synced, then renamed over the file, and the directory is synced so
+the rename itself is on disk too.
+"""
+import json
+import os
+
+def atomic_write_json(filename, data, **options):
+    """
+    Writes data as json to the file atomically. Options are passed to json.dump, e.g. indent.
+    """
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as f:
+        json.dump(data, f, **options)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpname, filename)
+    directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the BLE Sensor Client, running on the simulated BLE backend in fakeble.py.
+It needs no Bluetooth adapter and no dbus: the real sensor services of blesensordbusservice.py, with their publish
+policies and derived paths, publish to an in-process stand-in for VeDbusService, fed through the same dispatch and routing
+as the driver. The Venus OS and dbus modules the driver imports are replaced by stand-ins when they are not installed.
+
+Measures:
+- latency from notification to dbus publish, as percentiles
+- the maximum sustained notification rate
+- the time to reconnect after random disconnects
+- RSS and CPU time of the process under load
+- the latency and CPU time of the client running in a thread of its own against running on the main loop (--single-thread),
+  on a real GLib main loop with the asyncio loop of glibasyncio.py when PyGObject is installed
+- any of these with the devices spread over several simulated adapters (--adapters)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import resource
+import sys
+import time
+import types
+from fakeble import FakeBackend, FakePeripheral, FakeCharacteristic
+from sensorbleclient import SensorBLEClient
+from blesupervisor import SensorBLESupervisor
+from sensorconfig import CharacteristicTable
+
+try:
+    from gi.repository import GLib
+except ImportError:
+    GLib = None
+
+device_name = "ESP32 BLE Sensor Server"
+
+class QueueMainLoop:
+    """
+    Stand-in for the GLib main loop: idle_add queues a callable that run() calls on the benchmark thread.
+    """
+    name = 'queue'
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.dispatches = 0
+
+    def idle_add(self, callable, *args):
+        self.queue.put((callable, args))
+
+    def run(self, duration):
+        end = time.perf_counter() + duration
+        while True:
+            remaining = end - time.perf_counter()
+            if remaining <= 0:
+                return
+            try:
+                callable, args = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                return
+            self.dispatches += 1
+            callable(*args)
+
+class GLibMainLoop:
+    """
+    The GLib main loop with the asyncio loop of glibasyncio.py attached, as the driver runs with --single-thread.
+    """
+    name = 'glib'
+    _loop = None    # the asyncio loop is attached to the GLib main context once, and shared by the benchmarks
+
+    def __init__(self):
+        from glibasyncio import glib_event_loop
+        if GLibMainLoop._loop is None:
+            GLibMainLoop._loop = glib_event_loop()
+        self.GLib = GLib
+        self.loop = GLibMainLoop._loop
+        self.dispatches = 0
+
+    def call_soon(self, callable, *args):
+        self.dispatches += 1
+        self.loop.call_soon(callable, *args)
+
+    def run(self, duration):
+        mainloop = self.GLib.MainLoop()
+        self.GLib.timeout_add(max(1, int(duration * 1000)), lambda: mainloop.quit() or False)
+        mainloop.run()
+
+class AsyncioMainLoop:
+    """
+    Stand-in for the GLib main loop driving the asyncio loop the client runs on, used for --single-thread when PyGObject
+    is not installed. It does not exercise glibasyncio.py, so it only approximates the single-thread mode.
+    """
+    name = 'asyncio (PyGObject not installed, glibasyncio.py not exercised)'
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.dispatches = 0
+
+    def call_soon(self, callable, *args):
+        self.dispatches += 1
+        self.loop.call_soon(callable, *args)
+
+    def run(self, duration):
+        self.loop.run_until_complete(asyncio.sleep(duration))
+
+def single_thread_mainloop():
+    if GLib is not None:
+        return GLibMainLoop()
+    logging.warning("PyGObject is not installed, the single thread benchmark runs on a plain asyncio loop instead of the GLib main loop")
+    return AsyncioMainLoop()
+
+class BenchmarkVeDbusService:
+    """
+    Stand-in for VeDbusService: a dict of the path values. The /Level values are the time.perf_counter() the notification
+    was sent at, so every write of a level records its latency from notification to dbus publish.
+    """
+    latencies = None    # shared list the latencies are appended to, set by the benchmark
+
+    def __init__(self, servicename, bus=None, register=True):
+        self.values = {}
+        self.writes = 0
+
+    def add_path(self, path, value, description="", writeable=False, onchangecallback=None, gettextcallback=None, **kwargs):
+        self.values[path] = value
+
+    def __getitem__(self, path):
+        return self.values[path]
+
+    def __setitem__(self, path, value):
+        if path == '/Level':
+            self.latencies.append(time.perf_counter() - value)
+        self.writes += 1
+        self.values[path] = value
+
+class BenchmarkConnections:
+    """
+    Stand-in for DbusConnections, the services are not exported.
+    """
+    def acquire(self, servicename):
+        return None
+
+    def release(self, servicename):
+        pass
+
+class _StandInGLib:
+    """
+    Stand-in for the GLib scheduling used by the services when PyGObject is not installed. Timers are not run, the
+    benchmark sensors have no publish policies holding values back.
+    """
+    def timeout_add(self, interval, callback, *args):
+        return 0
+
+    timeout_add_seconds = timeout_add
+
+    def idle_add(self, callback, *args):
+        return 0
+
+    def source_remove(self, id):
+        pass
+
+class _StandInBusConnection:
+    TYPE_SYSTEM = 1
+    TYPE_SESSION = 0
+
+def _stand_in(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+def import_sensor_services():
+    """
+    Imports blesensordbusservice, with stand-ins for the modules of Venus OS, dbus and PyGObject that are not installed,
+    and returns its SensorDbusService publishing to a BenchmarkVeDbusService.
+    """
+    try:
+        import dbus.mainloop.glib
+    except ImportError:
+        bus = _stand_in('dbus.bus', BusConnection=_StandInBusConnection)
+        _stand_in('dbus', bus=bus, service=_stand_in('dbus.service'), mainloop=_stand_in('dbus.mainloop', glib=_stand_in('dbus.mainloop.glib', DBusGMainLoop=lambda **kwargs: None)))
+    if GLib is None:
+        _stand_in('gi', repository=_stand_in('gi.repository', GLib=_StandInGLib()))
+    for name, attributes in (('vedbus', {'VeDbusService': BenchmarkVeDbusService}), ('ve_utils', {'exit_on_error': lambda callback, *args: callback(*args)}), ('settingsdevice', {'SettingsDevice': None})):
+        try:
+            __import__(name)
+        except ImportError:
+            _stand_in(name, **attributes)
+    import blesensordbusservice
+    blesensordbusservice.VeDbusService = BenchmarkVeDbusService  # also on Venus OS, the benchmark does not export services
+    return blesensordbusservice.SensorDbusService
+
+class Benchmark:
+    """
+    A simulated setup of sensors, each with one characteristic notifying at a rate, published to stand-in services.
+    With several adapters there is a device per adapter, and the characteristics are spread over them.
+    """
+    def __init__(self, characteristics, rate, disconnect_rate=0, scan_time=0.5, connect_latency=0.1, single_thread=False, adapters=1):
+        uuids = ["0000%04x-0000-1000-8000-00805f9b34fb" % (0x2000 + index) for index in range(characteristics)]
+        names = [device_name] if adapters == 1 else ["%s %d" % (device_name, index) for index in range(adapters)]
+        sensors = [{"Type": "tank", "DeviceInstance": index, "Device": names[index % len(names)], "Paths": {
+                        '/Level': {'initial': 0, 'BLE_Char_UUID': uuid, 'Format': {'struct': '<d'}},
+                        '/Remaining': {'initial': 0, 'Derived': {'function': 'remaining', 'inputs': {'level': '/Level', 'capacity': '/Capacity'}}},
+                        '/Capacity': {'initial': 1}}} for index, uuid in enumerate(uuids)]
+        self.table = CharacteristicTable(sensors, device_name)
+        self.peripherals = [FakePeripheral(name, [FakeCharacteristic(uuid, rate=rate) for uuid in self.table.devices[name]], disconnect_rate=disconnect_rate) for name in names]
+        self.backends = [FakeBackend([peripheral], scan_time=scan_time, connect_latency=connect_latency) for peripheral in self.peripherals]
+        self.mainloop = single_thread_mainloop() if single_thread else QueueMainLoop()
+        self.latencies = []
+        BenchmarkVeDbusService.latencies = self.latencies
+        self.connected = []     # (device name, time.perf_counter()) of every connect
+        options = dict(dispatcher=self.mainloop.call_soon, loop=self.mainloop.loop) if single_thread else dict(dispatcher=self.mainloop.idle_add)
+        if adapters == 1:
+            self.client = SensorBLEClient(self.table.devices, decoders=self.table.decoders, backend=self.backends[0], **options)
+        else:
+            backends = {'hci%d' % index: backend for index, backend in enumerate(self.backends)}
+            self.client = SensorBLESupervisor(self.table.devices, list(backends), pinned={name: 'hci%d' % index for index, name in enumerate(names)}, decoders=self.table.decoders, backends=backends, **options)
+        SensorDbusService = import_sensor_services()
+        connections = BenchmarkConnections()
+        self.services = {}
+        for sensor in sensors:
+            service = SensorDbusService(sensor, self.client, connections, self.table)
+            self.services[service._servicename] = service
+        self.client.add_value_listener(self._publish_changes)
+        self.client.add_connection_listener(self._on_connection_changed)
+
+    def _publish_changes(self, changes):
+        for servicename, values in self.table.route(changes).items():
+            self.services[servicename].update_values(values)
+
+    def _on_connection_changed(self, name, connected, timestamp):
+        if connected:
+            self.connected.append((name, time.perf_counter()))
+
+    def start(self, timeout=10):
+        self.client.start_monitoring()
+        end = time.perf_counter() + timeout
+        while self._connected_devices() < len(self.peripherals) and time.perf_counter() < end:
+            self.mainloop.run(0.05)
+        if self._connected_devices() < len(self.peripherals):
+            raise Exception("Simulated devices did not connect")
+
+    def _connected_devices(self):
+        return len(set(name for name, connected in self.connected))
+
+    def measure(self, duration):
+        """
+        Runs the main loop for the duration and returns the statistics of that period.
+        """
+        del self.latencies[:]
+        sent = self.sent()
+        writes = self.writes()
+        dispatches = self.mainloop.dispatches
+        usage = ResourceUsage()
+        self.mainloop.run(duration)
+        result = usage.stop()
+        result.update({
+            'main_loop': self.mainloop.name,
+            'notifications_per_second': (self.sent() - sent) / duration,
+            'dispatches_per_second': (self.mainloop.dispatches - dispatches) / duration,
+            'dbus_writes_per_second': (self.writes() - writes) / duration,
+            'latency_ms': percentiles(self.latencies),
+        })
+        return result
+
+    def sent(self):
+        return sum(characteristic.sent for peripheral in self.peripherals for characteristic in peripheral.characteristics.values())
+
+    def writes(self):
+        return sum(service._dbusservice.writes for service in self.services.values())
+
+    def stop(self):
+        self.client.stop_monitoring()
+
+class ResourceUsage:
+    """
+    CPU time and RSS of the process, from the start until stop() is called.
+    """
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = self._cpu()
+
+    def _cpu(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def stop(self):
+        wall = time.perf_counter() - self.wall
+        return {
+            'cpu_percent': round(100 * (self._cpu() - self.cpu) / wall, 1),
+            'rss_mb': round(rss() / 1e6, 1),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+        }
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    def at(fraction):
+        return round(samples[min(int(fraction * len(samples)), len(samples) - 1)] * 1000, 3)
+    return {'count': len(samples), 'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(samples[-1] * 1000, 3)}
+
+def benchmark_latency(args, single_thread=None):
+    benchmark = Benchmark(args.characteristics, args.rate, single_thread=args.single_thread if single_thread is None else single_thread, adapters=args.adapters)
+    try:
+        benchmark.start()
+        return benchmark.measure(args.duration)
+    finally:
+        benchmark.stop()
+
+def benchmark_throughput(args):
+    """
+    Doubles the notification rate until the client can not keep up: the notifications are not all sent in time,
+    or the 99th percentile latency exceeds 100 ms.
+    """
+    rate = 50
+    sustained = None
+    steps = []
+    while rate * args.characteristics <= args.max_rate:
+        benchmark = Benchmark(args.characteristics, rate, single_thread=args.single_thread, adapters=args.adapters)
+        try:
+            benchmark.start()
+            result = benchmark.measure(min(args.duration, 3))
+        finally:
+            benchmark.stop()
+        offered = rate * args.characteristics
+        latency = result['latency_ms']
+        ok = result['notifications_per_second'] >= 0.95 * offered and latency is not None and latency['p99'] < 100
+        steps.append({'offered_per_second': offered, 'notifications_per_second': round(result['notifications_per_second']), 'p99_ms': latency['p99'] if latency else None, 'cpu_percent': result['cpu_percent'], 'sustained': ok})
+        if not ok:
+            break
+        sustained = offered
+        rate *= 2
+    return {'max_sustained_notifications_per_second': sustained, 'steps': steps}
+
+def benchmark_reconnect(args):
+    benchmark = Benchmark(args.characteristics, 1, disconnect_rate=args.disconnect_rate, single_thread=args.single_thread, adapters=args.adapters)
+    try:
+        benchmark.start()
+        result = benchmark.measure(args.duration)
+    finally:
+        benchmark.stop()
+    times = []
+    for peripheral in benchmark.peripherals:
+        for disconnected in peripheral.disconnects:
+            reconnected = [connected for name, connected in benchmark.connected if name == peripheral.name and connected > disconnected]
+            if reconnected:
+                times.append(reconnected[0] - disconnected)
+    return {'disconnects': sum(len(peripheral.disconnects) for peripheral in benchmark.peripherals), 'reconnect_ms': percentiles(times), 'scans': sum(backend.scans for backend in benchmark.backends), 'cpu_percent': result['cpu_percent']}
+
+def benchmark_threading(args):
+    """
+    Runs the latency benchmark with the client in a thread of its own and on the main loop.
+    """
+    return {'threaded': benchmark_latency(args, single_thread=False), 'single_thread': benchmark_latency(args, single_thread=True)}
+
+scenarios = {
+    'latency': benchmark_latency,
+    'throughput': benchmark_throughput,
+    'reconnect': benchmark_reconnect,
+    'threading': benchmark_threading,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BLE Sensor Client on a simulated BLE backend")
+    parser.add_argument("-d", "--debug", action="store_true", help="sets the logging level to debug")
+    parser.add_argument("--scenario", choices=['all'] + list(scenarios), default='all', help="benchmark to run")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to measure each benchmark")
+    parser.add_argument("--characteristics", type=int, default=10, help="number of simulated characteristics")
+    parser.add_argument("--rate", type=float, default=10, help="notifications per second per characteristic in the latency benchmark")
+    parser.add_argument("--max-rate", type=float, default=100000, help="highest total notification rate tried in the throughput benchmark")
+    parser.add_argument("--disconnect-rate", type=float, default=0.5, help="random disconnects per second in the reconnect benchmark")
+    parser.add_argument("--adapters", type=int, default=1, help="number of simulated adapters, each with a device of its own")
+    parser.add_argument("--single-thread", action="store_true", help="run the client on the main loop instead of in a thread of its own")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING, format="%(asctime)-15s %(name)-8s %(levelname)s: %(message)s")
+
+    results = {}
+    for name, scenario in scenarios.items():
+        if args.scenario in ('all', name):
+            results[name] = scenario(args)
+            if not args.json:
+                print("%s: %s" % (name, json.dumps(results[name], indent=2)))
+    if args.json:
+        print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
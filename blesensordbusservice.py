@@ -9,20 +9,27 @@ updates the dbus with the values read from the BLE server.
 The service is based on the dbusdummyservice.py example from the venus os project:
 https://github.com/victronenergy/velib_python/blob/master/dbusdummyservice.py
 """
+from startuptrace import StartupTrace
+trace = StartupTrace()  # created before the other imports, to time them
 import platform
 import argparse
 import logging
 import sys
 import os
 from datetime import datetime
-import struct
+import time
 import signal
+import json
 from os import _exit as os_exit
 from gi.repository import GLib
 from dbus.mainloop.glib import DBusGMainLoop
-import dbus
-import dbus.service
 from sensorbleclient import SensorBLEClient
+from blesupervisor import SensorBLESupervisor
+from dbusconnections import DbusConnections
+from sensorconfig import load_config, validate_sensors, service_name
+from publishpolicy import Publisher, PublishPolicy
+from derivedpaths import DerivedPaths
+from valuesnapshot import ValueSnapshot
 
 # import victron package for updating dbus (using lib from built in service)
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), '/opt/victronenergy/dbus-modem'))
@@ -30,11 +37,38 @@ from vedbus import VeDbusService
 from ve_utils import exit_on_error
 from settingsdevice import SettingsDevice
 
-# CONFIGURATION TODO: place in config file
-
-target_device_name = "ESP32 BLE Sensor Server" # name of the BLE server device to connect to
+# CONFIGURATION
+# the BLE server devices and the sensors are read from config_file when it exists, see blesensorclient.example.json.
+# Changes to it are applied while running, on SIGHUP or when the file changes, without dropping the BLE connections.
+# The sensors below are used when there is no config file. The other settings are read on startup only.
+
+config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blesensorclient.json') # config file with the target_device_name and the sensors
+config_check_interval = 5 # seconds between checks whether the config file changed
+target_device_name = "ESP32 BLE Sensor Server" # name of the default BLE server device to connect to
+
+device_cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devicecache.json') # last known addresses of the BLE server devices
+reset_after_failures = 5 # number of consecutive failed connection attempts before the Bluetooth adapter is reset
+bluetooth_adapters = None # adapters to spread the devices over, e.g. ['hci0', 'hci1'], each with a worker of its own. None uses the default adapter
+device_adapters = {} # adapter of devices that must use a certain adapter, e.g. {"ESP32 BLE Sensor Server": "hci1"}
+stats_interval = 10 # seconds between updates of the runtime statistics on the dbus
+connected_for_interval = 30 # seconds between updates of /ConnectedFor while connected, it is also updated on every connection change
+value_snapshot_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'valuesnapshot.json') # last known values, published on startup until the devices are connected
+snapshot_interval = 300 # minimum seconds between writes of the value snapshot, to spare the SD card
+snapshot_max_age = 24 * 3600 # seconds after which a value in the snapshot is too old to be published on startup
+record_history = False # record the sensor readings in a local history, queried with history-blesensorclient.py
+history_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history') # directory of the history segments
+history_interval = 10 # minimum seconds between two records of a reading in the history
+history_max_segments = 256 # number of 1 MB segments kept, older readings are removed
+stale_timeout = 30 # seconds after connecting that values from the snapshot not updated by the BLE server device are no longer waited for
 
 # array of sensors with metadata and settings
+# the BLE server device of a characteristic is set with "Device" on the path or on the sensor, and defaults to target_device_name
+# the wire format of a characteristic is set with "Format" on the path, see sensordecoders.py. Without a format doubles and unsigned integers are guessed
+# several paths, also of different sensors, can read from one characteristic carrying a packed record, by setting "byte_offset" in their "Format"
+# characteristics that can not notify are read periodically by setting "Read_Interval" in seconds on the path
+# noisy readings can be smoothed by setting "Filter" on the path to a list of filter stages, see sensorfilters.py
+# paths computed from other paths are declared with "Derived" on the path, see derivedpaths.py
+# dbus updates of a path can be limited with a deadband, minimum interval and heartbeat by setting "Publish" on the path, see publishpolicy.py
 # https://github.com/victronenergy/venus/wiki/dbus#tank-levels for more information on dbus paths
 sensors =   [
                 {
@@ -43,7 +77,7 @@ sensors =   [
                     "Paths":
                         {
                             '/Level': {'initial': 0, 'BLE_Char_UUID': '22d8381a-e6df-4ad1-a101-5e2e47c0762b'},
-                            '/Remaining' : {'initial': 1},  #m3 remaining in tank (calculated from level and capacity)
+                            '/Remaining' : {'initial': 1, 'Derived': {'function': 'remaining', 'inputs': {'level': '/Level', 'capacity': '/Capacity'}, 'round': 6}},  #m3 remaining in tank (calculated from level and capacity)
                             '/Capacity' : {'initial': 1},   #m3 total capacity of tank (100%)
                             '/FluidType' : {'initial': 1},  #0=Fuel; 1=Fresh water; 2=Waste water; 3=Live well; 4=Oil; 5=Black water (sewage); 6=Gasoline; 7=Diesel; 8=Liquid  Petroleum Gas (LPG); 9=Liquid Natural Gas (LNG); 10=Hydraulic oil; 11=Raw water
                             '/Status' : {'initial': 0},
@@ -58,7 +92,7 @@ sensors =   [
                     "Paths":
                         {
                             '/Level': {'initial': 0, 'BLE_Char_UUID': '9910102a-9d4e-41ce-be93-affba54425c4'},
-                            '/Remaining' : {'initial': 1},  #m3 remaining in tank (calculated from level and capacity)
+                            '/Remaining' : {'initial': 1, 'Derived': {'function': 'remaining', 'inputs': {'level': '/Level', 'capacity': '/Capacity'}, 'round': 6}},  #m3 remaining in tank (calculated from level and capacity)
                             '/Capacity' : {'initial': 1},   #m3 total capacity of tank (100%)
                             '/FluidType' : {'initial': 5},  #0=Fuel; 1=Fresh water; 2=Waste water; 3=Live well; 4=Oil; 5=Black water (sewage); 6=Gasoline; 7=Diesel; 8=Liquid  Petroleum Gas (LPG); 9=Liquid Natural Gas (LNG); 10=Hydraulic oil; 11=Raw water
                             '/Status' : {'initial': 0},
@@ -84,24 +118,13 @@ sensors =   [
 
 # END CONFIGURATION
 
-
-class SystemBus(dbus.bus.BusConnection):
-    def __new__(cls):
-        return dbus.bus.BusConnection.__new__(cls, dbus.bus.BusConnection.TYPE_SYSTEM)
-
-class SessionBus(dbus.bus.BusConnection):
-    def __new__(cls):
-        return dbus.bus.BusConnection.__new__(cls, dbus.bus.BusConnection.TYPE_SESSION)
-
-def dbusconnection():
-    return SessionBus() if 'DBUS_SESSION_BUS_ADDRESS' in os.environ else SystemBus()
-
 class SensorDbusService:
-    def __init__(self, metadata, bleclient):
+    def __init__(self, metadata, bleclient, connections, characteristics, poll=False):
         self._bleclient = bleclient
+        self._connections = connections
         self._metadata = metadata
-        self._servicename = 'com.victronenergy.'+ str(metadata["Type"]) + '.ble_' + str(metadata["Type"]) + '_sensor_' + str(metadata["DeviceInstance"])
-        self._dbusservice = VeDbusService(self._servicename, dbusconnection())
+        self._servicename = service_name(metadata)
+        self._dbusservice = VeDbusService(self._servicename, connections.acquire(self._servicename))
 
         # Create the management objects, as specified in the ccgx dbus-api document
         self._dbusservice.add_path('/Mgmt/ProcessName', __file__)
@@ -116,62 +139,155 @@ class SensorDbusService:
         self._dbusservice.add_path('/HardwareVersion', 1.0)
         self._dbusservice.add_path('/Connected', 0)
 
+        self._publisher = Publisher(self._dbusservice, {path: PublishPolicy(**settings['Publish']) for path, settings in metadata["Paths"].items() if 'Publish' in settings},
+                                    schedule=lambda delay, callback: GLib.timeout_add(int(delay * 1000), exit_on_error, callback),
+                                    on_write=bleclient.stats.dbus_write, on_suppress=bleclient.stats.dbus_suppress)
+        self._publisher.set_shadow('/Connected', 0)
+
+        self._fields = {}  # ((device name, uuid), field index) read by each BLE path
         for path, settings in self._metadata["Paths"].items():
             self._dbusservice.add_path(path, settings['initial'], writeable=True, onchangecallback=self._handlechangedvalue)
-
-        GLib.timeout_add(1000, exit_on_error, self._update)    # Update the sensor every second
+            self._publisher.set_shadow(path, settings['initial'])
+            if 'BLE_Char_UUID' in settings:
+                self._fields[path] = characteristics.fields[(self._servicename, path)]
+        self._devices = set(key[0] for key, index in self._fields.values()) # devices this sensor reads from
+        self._stale = set() # paths still showing a value from the snapshot, /Connected stays 0 until they are updated
+        self._stale_timer = None
+        self._closed = False
+
+        self._derived = DerivedPaths(self._metadata["Paths"])
+        self._update_derived({path: settings['initial'] for path, settings in self._metadata["Paths"].items() if 'Derived' not in settings})
+
+        self._poll_timer = None
+        if poll:
+            self._poll_timer = GLib.timeout_add(1000, exit_on_error, self._update)    # Update the sensor every second
+        else:
+            bleclient.add_connection_listener(self._on_connection_changed)  # Values are pushed by the router in main
         
         logging.info("Service %s started" % self._servicename)
 
+    def close(self):
+        """
+        Removes the service from the dbus, when it is removed from the config or replaced by a changed one.
+        """
+        self._closed = True
+        if self._stale_timer is not None:
+            GLib.source_remove(self._stale_timer)
+            self._stale_timer = None
+        if self._poll_timer is not None:
+            GLib.source_remove(self._poll_timer)
+            self._poll_timer = None
+        else:
+            self._bleclient.remove_connection_listener(self._on_connection_changed)
+        self._publisher.close()
+        self._connections.release(self._servicename)
+        logging.info("Service %s stopped" % self._servicename)
+
     def _handlechangedvalue(self, path, value):
         logging.info("Someone else updated %s to %s" % (path, value))
-        return True # accept the change
+        self._publisher.set_shadow(path, value)
+        self._update_derived({path: value})
         return True # accept the change
     
-    def _update(self):
-        if not self._bleclient.is_connected():
+    def _update_connected(self):
+        if self._closed:
+            return False
+        connected = all(self._bleclient.is_connected(device) for device in self._devices)
+        if not connected:
             logging.debug("Not connected, skipping update sensor since not connected")
-            if self._dbusservice["/Connected"] == 1:
-                self._dbusservice["/Connected"] = 0
-            return True # return True to keep the timeout running
-        
-        if self._dbusservice["/Connected"] == 0:
-            self._dbusservice["/Connected"] = 1
-
-        type = self._metadata["Type"]
-        if type == "temperature":
-            self.update_sensor_value("/Temperature")
-            self.update_sensor_value("/Humidity")
-        elif type == "tank":
-            if self.update_sensor_value("/Level"):
-                remaining = round(self._metadata["Paths"]["/Capacity"]["initial"] * (self._dbusservice["/Level"] / 100), 6) # calculate remaining volume based on level and capacity, round to 6 decimals since it is in m3
-                self._dbusservice["/Remaining"] = remaining
-                logging.debug("Updated %s%s to %s" % (self._servicename, "/Remaining", remaining))   
+            self._publisher.publish("/Connected", 0)
+        elif not self._stale:
+            self._publisher.publish("/Connected", 1)
+        return connected
+
+    def _on_connection_changed(self, device_name, connected, timestamp):
+        if device_name in self._devices:
+            if connected and self._stale and self._stale_timer is None:
+                self._stale_timer = GLib.timeout_add_seconds(stale_timeout, exit_on_error, self._expire_stale)
+            self._update_connected()
+
+    def seed_values(self, values, timestamp):
+        """
+        Publishes the last known values from the snapshot, by path. They are stale until updated by the BLE server device.
+        """
+        logging.info("Seeding %s with %d values from %s", self._servicename, len(values), datetime.fromtimestamp(timestamp))
+        for path, value in values.items():
+            self._publisher.write(path, value)  # not held back, the seeded values replace the initial ones right away
+        self._stale.update(values)
+        self._update_derived(values)
+
+    def publish_current(self, values, timestamp):
+        """
+        Publishes the values the BLE client already has, by path, for a service created by reloading the config.
+        """
+        if all(self._bleclient.is_connected(device) for device in self._devices):
+            self.update_values(values)
         else:
-            logging.error("Unknown sensor type: %s" % type)
+            self.seed_values(values, timestamp)
+
+    def _expire_stale(self):
+        self._stale_timer = None
+        if self._stale and not self._closed:
+            logging.info("No new values for %s of %s, no longer waiting for them", ', '.join(sorted(self._stale)), self._servicename)
+            self._stale.clear()
+            self._update_connected()
+        return False    # run once
+
+    def _update(self):
+        if not self._update_connected():
+            return True # return True to keep the timeout running
+        self._update_paths({path: None for path in self._fields})
         return True     # return True to keep the timeout running
 
-    def update_sensor_value(self, path):
-        metadata = self._metadata
-        uuid = metadata["Paths"][path]["BLE_Char_UUID"]
-        data = self._bleclient.get_characteristic_value(uuid)
-        if data is None:
-            return False # try again later
-        logging.debug("Got characteristic (%s) value: %r", uuid, data)
-        if len(data) >= 8:  # Ensure data has at least 8 bytes
-            double_value = struct.unpack('d', data)[0]
-            value = round(double_value, 1)
-        else:
-            value = int.from_bytes(data, byteorder='little')
-        self._dbusservice[path] = value
-        logging.debug("Updated %s%s to %s" % (self._servicename, path, self._dbusservice[path]))
-        return True
+    def update_values(self, values):
+        """
+        Updates the sensor with the changed values pushed by the BLE client, by path.
+        """
+        self._update_paths(values)
+        self._update_connected()    # not just 1: the sensor may read from another device that is down
+
+    def _update_paths(self, values):
+        updated = {}
+        for path, value in values.items():
+            value = self.update_sensor_value(path, value)
+            if value is not None:
+                updated[path] = value
+        if self._stale and updated:
+            self._stale.difference_update(updated)
+            if not self._stale:
+                self._update_connected()
+        self._update_derived(updated)
+
+    def _update_derived(self, changes):
+        """
+        Recomputes the derived paths depending on the changed paths from the live values of their other inputs.
+        """
+        if not self._derived:
+            return
+        for path, value in self._derived.update(changes, self._dbusservice.__getitem__).items():
+            if self._publisher.publish(path, value):
+                logging.debug("Updated %s%s to %s" % (self._servicename, path, value))
+
+    def update_sensor_value(self, path, value=None):
+        """
+        Publishes the value of a path, reading it from the BLE client if not given. Returns the value, or None if there is none yet.
+        """
+        key, index = self._fields[path]
+        if value is None:
+            record = self._bleclient.get_characteristic_value(*key)
+            value = record[index] if record is not None else None
+        if value is None:
+            return None # try again later
+        logging.debug("Got characteristic (%s) value: %r", key[1], value)
+        if self._publisher.publish(path, value):
+            logging.debug("Updated %s%s to %s" % (self._servicename, path, value))
+        return value
 
 class ClientDbusService:
-    def __init__(self, bleclient):
+    def __init__(self, bleclient, connections, sensor_count):
         self._bleclient = bleclient
         self._servicename = 'com.victronenergy.BLESensorClient'
-        self._dbusservice = VeDbusService(self._servicename, dbusconnection())
+        self._dbusservice = VeDbusService(self._servicename, connections.shared())
 
         # Create the management objects, as specified in the ccgx dbus-api document
         self._dbusservice.add_path('/Mgmt/ProcessName', __file__)
@@ -189,16 +305,59 @@ class ClientDbusService:
         # Create specific paths for the client
         self._dbusservice.add_path('/State', '-', writeable=True)
         self._dbusservice.add_path('/ConnectedFor', '-', writeable=True)
-        self._dbusservice.add_path('/NumberOfSensors', len(sensors), writeable=True)
+        self._dbusservice.add_path('/NumberOfSensors', sensor_count, writeable=True)
+
+        # Create the runtime statistics, see sensorstats.py
+        self._characteristics = []
+        self._characteristic_paths = 0  # number of /Stats/Characteristics entries on the dbus
+        self._update_characteristics()
+        self._dbusservice.add_path('/Stats/NotificationsPerSecond', 0)
+        self._dbusservice.add_path('/Stats/DbusWritesPerSecond', 0)
+        for histogram in ('PublishLatency', 'DispatchDelay', 'LockWait', 'ScanTime'):
+            for field in ('P50', 'P90', 'P99', 'Max', 'Histogram'):
+                self._dbusservice.add_path('/Stats/%s/%s' % (histogram, field), None)
+        self._dbusservice.add_path('/Stats/Reconnects', 0)
+        self._dbusservice.add_path('/Stats/ReconnectTime/Last', None)
+        self._dbusservice.add_path('/Stats/ReconnectTime/Mean', None)
+        GLib.timeout_add_seconds(stats_interval, exit_on_error, self._update_stats)
 
         # create the setting that allows enabling the RPI shutdown pin
         settingsList = {'Enabled': [ '/Settings/BLESensorClient/Enabled', 0, 0, 0 ],}
-        self.dbusSettings = SettingsDevice(bus=dbus.SystemBus(), supportedSettings=settingsList, timeout = 10, eventCallback = self._handle_enabled_changed)
+        self.dbusSettings = SettingsDevice(bus=connections.shared(), supportedSettings=settingsList, timeout = 10, eventCallback = self._handle_enabled_changed)
 
-        GLib.timeout_add(2000, exit_on_error, self._update_state)    # Update the dbus every 2 second
+        self._connected_for_timer = None
+        bleclient.add_connection_listener(self._on_connection_changed)  # Update the state when a device connects or disconnects
+        self._update_state()
 
         logging.info("Service %s started" % self._servicename)
 
+    def _update_characteristics(self):
+        """
+        Lists the characteristics of the devices in /Stats/Characteristics. Entries no longer used after a reload are emptied.
+        """
+        self._characteristics = [(name, uuid) for name, device in self._bleclient.devices.items() for uuid in device.characteristic_uuids]
+        for index in range(max(len(self._characteristics), self._characteristic_paths)):
+            name, uuid = self._characteristics[index] if index < len(self._characteristics) else (None, None)
+            if index < self._characteristic_paths:
+                self._dbusservice['/Stats/Characteristics/%d/Device' % index] = name
+                self._dbusservice['/Stats/Characteristics/%d/Uuid' % index] = uuid
+                self._dbusservice['/Stats/Characteristics/%d/NotificationsPerSecond' % index] = 0 if name is not None else None
+                self._dbusservice['/Stats/Characteristics/%d/ValueAge' % index] = None
+            else:
+                self._dbusservice.add_path('/Stats/Characteristics/%d/Device' % index, name)
+                self._dbusservice.add_path('/Stats/Characteristics/%d/Uuid' % index, uuid)
+                self._dbusservice.add_path('/Stats/Characteristics/%d/NotificationsPerSecond' % index, 0)
+                self._dbusservice.add_path('/Stats/Characteristics/%d/ValueAge' % index, None)
+        self._characteristic_paths = max(len(self._characteristics), self._characteristic_paths)
+
+    def update_sensors(self, sensor_count):
+        """
+        Updates the number of sensors and the characteristics after the config was reloaded.
+        """
+        self._dbusservice['/NumberOfSensors'] = sensor_count
+        self._update_characteristics()
+        self._update_state()
+
     def _handle_enabled_changed(self, setting, old, new):
         logging.info("Enabled changed from %s to %s" % (old, new))
         if new == 0:
@@ -207,25 +366,111 @@ class ClientDbusService:
             self._bleclient.start_monitoring()
         return True # accept the change
     
+    def _on_connection_changed(self, device_name, connected, timestamp):
+        logging.info("Device %s %s at %s" % (device_name, 'connected' if connected else 'disconnected', timestamp))
+        self._update_state()
+
     def _update_state(self):
         logging.debug("Updating state of the Client DbusService")
-        self._dbusservice['/State'] = 'Connected' if self._bleclient.is_connected() else 'Not connected'
-        self._dbusservice['/ConnectedFor'] = str(datetime.now() - self._bleclient.connected_at).split('.')[0] if self._bleclient.connected_at is not None else '-'
+        connected = self._bleclient.connected_count()
+        if connected == len(self._bleclient.devices):
+            self._dbusservice['/State'] = 'Connected'
+        elif connected > 0:
+            self._dbusservice['/State'] = 'Connected to %d of %d devices' % (connected, len(self._bleclient.devices))
+        else:
+            self._dbusservice['/State'] = 'Not connected'
+        self._update_connected_for()
+        if self._bleclient.connected_at is not None and self._connected_for_timer is None:
+            self._connected_for_timer = GLib.timeout_add_seconds(connected_for_interval, exit_on_error, self._tick_connected_for)  # Count up while connected
+
+    def _update_connected_for(self):
+        connected_at = self._bleclient.connected_at
+        self._dbusservice['/ConnectedFor'] = str(datetime.now() - connected_at).split('.')[0] if connected_at is not None else '-'
+        return connected_at is not None
+
+    def _update_stats(self):
+        stats = self._bleclient.stats
+        stats.tick()
+        now = time.time()
+        for index, key in enumerate(self._characteristics):
+            sample = self._bleclient.values.get_sample(key)
+            self._dbusservice['/Stats/Characteristics/%d/NotificationsPerSecond' % index] = round(stats.notification_rates.get(key, 0.0), 2)
+            self._dbusservice['/Stats/Characteristics/%d/ValueAge' % index] = round(now - sample[0]) if sample is not None else None
+        self._dbusservice['/Stats/NotificationsPerSecond'] = round(sum(stats.notification_rates.values()), 2)
+        self._dbusservice['/Stats/DbusWritesPerSecond'] = round(stats.dbus_writes_per_second, 2)
+        for name, histogram in (('PublishLatency', stats.publish_latency), ('DispatchDelay', stats.dispatch_delay), ('LockWait', stats.lock_wait), ('ScanTime', stats.scan_time)):
+            summary = histogram.last.summary()
+            for field in ('P50', 'P90', 'P99', 'Max'):
+                self._dbusservice['/Stats/%s/%s' % (name, field)] = summary[field.lower()]
+            self._dbusservice['/Stats/%s/Histogram' % name] = histogram.last.text()
+        reconnects = [reconnect for reconnect in stats.reconnects.values()]
+        self._dbusservice['/Stats/Reconnects'] = sum(reconnect['count'] for reconnect in reconnects)
+        if reconnects:
+            self._dbusservice['/Stats/ReconnectTime/Last'] = round(max(reconnects, key=lambda reconnect: reconnect['at'])['last'], 1)   # the most recent reconnect of any device
+            self._dbusservice['/Stats/ReconnectTime/Mean'] = round(sum(reconnect['total'] for reconnect in reconnects) / sum(reconnect['count'] for reconnect in reconnects), 1)
         return True
 
-def main():
+    def _tick_connected_for(self):
+        if self._update_connected_for():
+            return True
+        self._connected_for_timer = None
+        return False    # stop the timeout until connected again
+
+def file_signature(filename):
+    """
+    Returns the modification time and size of a file, to notice changes, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def history_labels(characteristics):
+    """
+    Returns the dbus paths publishing each field of a characteristic, by (device name, uuid, field index).
+    """
+    labels = {}
+    for key, routes in characteristics.routes.items():
+        for servicename, path, index in routes:
+            labels.setdefault((key[0], key[1], index), []).append(servicename + path)
+    return labels
+
+def main(poll=False, single_thread=False):
+    trace.phase('imports')
     # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
     DBusGMainLoop(set_as_default=True)
     mainloop = GLib.MainLoop()
 
-    # pass all sensor UUIDs to the BLE client to monitor
-    uuids = []
-    for sensor in sensors:
-        for path, settings in sensor["Paths"].items():
-            if "BLE_Char_UUID" in settings:
-                uuids.append(settings["BLE_Char_UUID"])
-    logging.info('Starting BLE Sensor Client with target device name: %s and UUIDs: %s', target_device_name, uuids)
-    sensorClient = SensorBLEClient(target_device_name, uuids, mainloop)
+    # pass all sensor UUIDs to the BLE client to monitor, grouped by device, with their compiled decoders
+    if os.path.exists(config_file):
+        config_signature = file_signature(config_file)
+        _, sensor_config, characteristics = load_config(config_file)
+        logging.info('Read the config from %s', config_file)
+    else:
+        config_signature = None
+        sensor_config, characteristics = sensors, validate_sensors(sensors, target_device_name)
+    logging.info('Starting BLE Sensor Client with devices and UUIDs: %s', characteristics.devices)
+    recorder = None
+    if record_history:
+        from historyrecorder import HistoryRecorder
+        recorder = HistoryRecorder(history_directory, labels=history_labels(characteristics), interval=history_interval, max_segments=history_max_segments)
+        GLib.timeout_add_seconds(history_interval, exit_on_error, recorder.tick)   # records held back values and writes the buffer
+    if single_thread:
+        # run bleak on the GLib main loop, so BLE callbacks and dbus updates share this thread
+        from glibasyncio import glib_event_loop
+        loop = glib_event_loop()
+        dispatcher = loop.call_soon
+    else:
+        loop = None
+        dispatcher = GLib.idle_add
+    options = dict(dispatcher=dispatcher, decoders=characteristics.decoders, read_intervals=characteristics.read_intervals, cache_file=device_cache_file, reset_after_failures=reset_after_failures, recorder=recorder, loop=loop)
+    if bluetooth_adapters:
+        sensorClient = SensorBLESupervisor(characteristics.devices, bluetooth_adapters, pinned=device_adapters, **options)
+    else:
+        sensorClient = SensorBLEClient(characteristics.devices, **options)
+
+    snapshot = ValueSnapshot(value_snapshot_file, schedule=lambda delay, callback: GLib.timeout_add(int(delay * 1000), exit_on_error, callback), interval=snapshot_interval)
 
     # Handle signals to ensure cleanup of the client
     def cleanup(signum, frame):
@@ -234,6 +479,9 @@ def main():
             if sensorClient is not None:
                 logging.info('Disconnecting client...')
                 sensorClient.stop_monitoring()
+            snapshot.write()
+            if recorder is not None:
+                recorder.flush()
             mainloop.quit()
         except Exception as e:
             logging.error('Error in signal handler: %s', e)
@@ -242,22 +490,136 @@ def main():
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGTERM, cleanup)
 
-    # Create the dbus services
-    clientDbusService = ClientDbusService(sensorClient)
-    for sensor in sensors:
-        SensorDbusService(sensor, sensorClient)
+    # Dump a detailed snapshot of the runtime statistics to the log
+    def dump_stats():
+        logging.info('Statistics: %s', json.dumps(sensorClient.stats.snapshot(sensorClient.values), indent=2))
+        return False    # run once
+    signal.signal(signal.SIGUSR1, lambda signum, frame: GLib.idle_add(exit_on_error, dump_stats))   # on the main loop, not in the middle of updating the statistics
+
+    trace.phase('config')
 
+    # Create the client service and read the settings first, to know whether the BLE client is enabled
+    connections = DbusConnections()
+    clientDbusService = ClientDbusService(sensorClient, connections, len(sensor_config))
     if(clientDbusService.dbusSettings is not None):
         logging.info('Settings device created')
-    
+    trace.phase('settings')
+
+    services = {}
+    # fan out each batch of changed characteristics to the paths of all services reading from them, in one dispatch
+    def publish_changes(changes):
+        for servicename, values in characteristics.route(changes).items():
+            services[servicename].update_values(values)
+        now = time.time()
+        for key in changes:
+            sample = sensorClient.values.get_sample(key)
+            if sample is not None:
+                sensorClient.stats.publish_latency.record(now - sample[0])
+                snapshot.update(key, *sample)
+    if not poll:
+        sensorClient.add_value_listener(publish_changes)
+    else:
+        def snapshot_values():
+            for key in sensorClient.values.keys():
+                snapshot.update(key, *sensorClient.values.get_sample(key))
+            return True
+        GLib.timeout_add_seconds(snapshot_interval, exit_on_error, snapshot_values)
+
+    # Start scanning before the sensor services are registered. Values and connection changes are dispatched
+    # on the main loop, so they only reach the services once all of them are registered and the main loop runs
     if clientDbusService.dbusSettings["Enabled"] == 1:
         sensorClient.start_monitoring()
     else:
         logging.info('BLE Sensor Client is disabled')
+    trace.phase('ble start')
+
+    # Create the dbus services
+    for sensor in sensor_config:
+        service = SensorDbusService(sensor, sensorClient, connections, characteristics, poll)
+        services[service._servicename] = service
+    logging.info('Registered %d dbus services on %d dbus connections', len(sensor_config) + 1, connections.count())
+    trace.phase('services')
+
+    # publish the last known values until the devices are connected
+    for key, (timestamp, record) in snapshot.load(snapshot_max_age).items():
+        if max((index for servicename, path, index in characteristics.routes.get(key, ())), default=len(record)) >= len(record):
+            continue    # the format of the characteristic changed since the snapshot was written
+        for servicename, values in characteristics.route({key: record}).items():
+            services[servicename].seed_values(values, timestamp)
+    trace.phase('snapshot')
+
+    # Apply changes to the config file while running. Only the services of changed sensors are replaced, the BLE
+    # connections stay up and only the characteristics that changed are subscribed to or unsubscribed from
+    def reload_config():
+        nonlocal sensor_config, characteristics, config_signature
+        config_signature = file_signature(config_file)
+        try:
+            _, new_sensors, new_characteristics = load_config(config_file)
+        except Exception as e:
+            logging.error('Invalid config %s, keeping the running config: %s', config_file, e)
+            return False
+        old_characteristics = characteristics
+        old = {service_name(sensor): sensor for sensor in sensor_config}
+        new = {service_name(sensor): sensor for sensor in new_sensors}
+        def fields(characteristics, servicename):
+            return {path: field for (name, path), field in characteristics.fields.items() if name == servicename}
+        changed = set(servicename for servicename in set(old) & set(new)
+                      if old[servicename] != new[servicename] or fields(characteristics, servicename) != fields(new_characteristics, servicename))
+        for servicename in (set(old) - set(new)) | changed:
+            services.pop(servicename).close()
+        sensor_config, characteristics = new_sensors, new_characteristics
+        sensorClient.update_devices(characteristics.devices, characteristics.decoders, characteristics.read_intervals)
+        if recorder is not None:
+            recorder.labels = history_labels(characteristics)
+        created = (set(new) - set(old)) | changed
+        for servicename in sorted(created):
+            services[servicename] = SensorDbusService(new[servicename], sensorClient, connections, characteristics, poll)
+        # publish the values already received, except those decoded with a Format or Filter that changed
+        current = {}
+        for key in sensorClient.values.keys():
+            timestamp, record = sensorClient.values.get_sample(key)
+            if not isinstance(record, tuple) or old_characteristics.formats.get(key) != characteristics.formats.get(key):
+                continue
+            for servicename, values in characteristics.route({key: record}).items():
+                if servicename in created:
+                    entry = current.setdefault(servicename, [timestamp, {}])
+                    entry[0] = min(entry[0], timestamp)
+                    entry[1].update(values)
+        for servicename, (timestamp, values) in current.items():
+            services[servicename].publish_current(values, timestamp)
+        clientDbusService.update_sensors(len(sensor_config))
+        logging.info('Reloaded the config from %s: %d sensors added, %d removed, %d changed', config_file, len(set(new) - set(old)), len(set(old) - set(new)), len(changed))
+        return False    # run once
+    def check_config():
+        signature = file_signature(config_file)
+        if signature is not None and signature != config_signature:
+            reload_config()
+        return True
+    GLib.timeout_add_seconds(config_check_interval, exit_on_error, check_config)
+    signal.signal(signal.SIGHUP, lambda signum, frame: GLib.idle_add(exit_on_error, reload_config))
+
+    # Trace the startup until the main loop runs, the first device is connected and the first values are published
+    def trace_mainloop():
+        trace.phase('main loop')
+        trace.log()
+        return False
+    GLib.idle_add(trace_mainloop)
+    def trace_connected(device_name, connected, timestamp):
+        if connected:
+            trace.event('first device connected')
+            sensorClient.remove_connection_listener(trace_connected)   # the listeners are dispatched from a copy
+    sensorClient.add_connection_listener(trace_connected)
+    def trace_values(changes):
+        trace.event('first values published')
+        sensorClient.remove_value_listener(trace_values)
+    sensorClient.add_value_listener(trace_values)
 
     logging.info('Connected to dbus, and switching over to GLib.MainLoop() (= event based)')
     mainloop.run()
     sensorClient.stop_monitoring()
+    snapshot.write()
+    if recorder is not None:
+        recorder.flush()
     logging.info('Exiting...')
 
 if __name__ == "__main__":
@@ -268,8 +630,18 @@ if __name__ == "__main__":
         action="store_true",
         help="sets the logging level to debug",
     )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="poll the BLE client every second instead of updating the dbus when notified of changed values",
+    )
+    parser.add_argument(
+        "--single-thread",
+        action="store_true",
+        help="run the BLE client on the GLib main loop instead of in a thread of its own",
+    )
     args = parser.parse_args()
     log_level = logging.DEBUG if args.debug else logging.INFO
     logging.basicConfig(level=log_level, format="%(asctime)-15s %(name)-8s %(levelname)s: %(message)s")
-    main()
+    main(args.poll, args.single_thread)
     
\ No newline at end of file
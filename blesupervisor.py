@@ -0,0 +1,155 @@
+"""
+Spreads the BLE server devices over several Bluetooth adapters, e.g. hci0 and a second USB dongle hci1 for range.
+Each adapter is served by its own SensorBLEClient worker, with its own monitoring thread, connections, backoff and adapter
+reset, so resetting one adapter does not disconnect the devices on another. The number of connections and the notification
+throughput scale with the number of adapters.
+
+The supervisor offers the api of SensorBLEClient the dbus services use, so they do not know how many adapters there are.
+The workers share the SensorStats, the ValueStore and the history recorder, and hand their values to the listeners
+registered on the supervisor through the dispatcher on the main loop.
+"""
+import logging
+import os
+from sensorbleclient import SensorBLEClient
+from sensorstats import SensorStats
+from valuestore import ValueStore
+
+def assign_adapters(devices, adapters, pinned=None):
+    """
+    Returns {adapter: {device name: [uuids]}}. Pinned devices go to their adapter, the others to the adapter with the
+    fewest characteristics so far, largest devices first.
+    """
+    pinned = pinned or {}
+    for name, adapter in pinned.items():
+        if adapter not in adapters:
+            raise ValueError("Device '%s' is assigned to unknown adapter %s" % (name, adapter))
+    assignment = {adapter: {} for adapter in adapters}
+    load = {adapter: 0 for adapter in adapters}
+    for name in sorted(devices, key=lambda name: (name not in pinned, -len(devices[name]), name)):
+        adapter = pinned.get(name) or min(adapters, key=lambda adapter: (load[adapter], adapters.index(adapter)))
+        assignment[adapter][name] = devices[name]
+        load[adapter] += len(devices[name])
+    return assignment
+
+def _adapter_file(filename, adapter, first):
+    """
+    Returns the file of an adapter, e.g. devicecache-hci1.json. The first adapter keeps the file name of a single adapter.
+    """
+    if filename is None or first:
+        return filename
+    root, extension = os.path.splitext(filename)
+    return '%s-%s%s' % (root, adapter, extension)
+
+class SensorBLESupervisor:
+    def __init__(self, devices, adapters, pinned=None, cache_file=None, history_size=256, stats=None, backends=None, **options):
+        """
+        devices: dict of {device name: [characteristic uuids]} to connect to and subscribe to.
+        adapters: Bluetooth adapters to spread the devices over, e.g. ['hci0', 'hci1'].
+        pinned: dict of {device name: adapter} of devices that must use a certain adapter.
+        cache_file: device cache of the first adapter, the others get one of their own next to it.
+        backends: dict of {adapter: backend}, e.g. simulated adapters. Defaults to bleak.
+        Other options are passed to every SensorBLEClient.
+        """
+        self.logger = logging.getLogger(__name__) # create logger
+        self.adapters = list(adapters)
+        self.pinned = pinned or {}
+        self.stats = stats if stats is not None else SensorStats()
+        self.values = ValueStore(history_size)
+        self.workers = {}   # SensorBLEClient by adapter
+        self.devices = {}   # SensorBLEDevice by device name, of all workers
+        self._cache_file = cache_file
+        self._history_size = history_size
+        self._backends = backends or {}
+        self._options = options
+        self._value_listeners = []
+        self._connection_listeners = []
+        self._monitoring = False
+        for adapter, adapter_devices in assign_adapters(devices, self.adapters, self.pinned).items():
+            if adapter_devices:
+                self.logger.info("Adapter %s serves %s", adapter, ', '.join(adapter_devices))
+                self._add_worker(adapter, adapter_devices)
+
+    def _add_worker(self, adapter, devices):
+        worker = SensorBLEClient(devices, adapter=adapter, cache_file=_adapter_file(self._cache_file, adapter, adapter == self.adapters[0]),
+                                 history_size=self._history_size, stats=self.stats, values=self.values, backend=self._backends.get(adapter), **self._options)
+        for listener in self._value_listeners:
+            worker.add_value_listener(listener)
+        for listener in self._connection_listeners:
+            worker.add_connection_listener(listener)
+        self.workers[adapter] = worker
+        self.devices.update(worker.devices)
+        return worker
+
+    def update_devices(self, devices, decoders=None, read_intervals=None):
+        """
+        Applies a reloaded config. Devices stay on the adapter they are connected with, new devices go to their pinned
+        adapter or to the adapter with the fewest characteristics. Adapters are not added or removed by a reload.
+        """
+        self._options.update(decoders=decoders, read_intervals=read_intervals)
+        current = {name: adapter for adapter, worker in self.workers.items() for name in worker.devices}
+        assignment = {adapter: {} for adapter in self.adapters}
+        load = {adapter: 0 for adapter in self.adapters}
+        for name in sorted(devices, key=lambda name: (name not in current, name not in self.pinned, -len(devices[name]), name)):
+            adapter = current.get(name) or self.pinned.get(name) or min(self.adapters, key=lambda adapter: (load[adapter], self.adapters.index(adapter)))
+            assignment[adapter][name] = devices[name]
+            load[adapter] += len(devices[name])
+        self.devices = {}
+        for adapter, adapter_devices in assignment.items():
+            worker = self.workers.get(adapter)
+            if worker is not None:
+                worker.update_devices(adapter_devices, decoders, read_intervals)
+                self.devices.update(worker.devices)
+            elif adapter_devices:
+                self.logger.info("Adapter %s serves %s", adapter, ', '.join(adapter_devices))
+                worker = self._add_worker(adapter, adapter_devices)
+                if self._monitoring:
+                    worker.start_monitoring()
+
+    @property
+    def connected_at(self):
+        connected = [worker.connected_at for worker in self.workers.values() if worker.connected_at is not None]
+        return min(connected) if connected else None
+
+    def add_value_listener(self, listener):
+        self._value_listeners.append(listener)
+        for worker in self.workers.values():
+            worker.add_value_listener(listener)
+
+    def add_connection_listener(self, listener):
+        self._connection_listeners.append(listener)
+        for worker in self.workers.values():
+            worker.add_connection_listener(listener)
+
+    def remove_value_listener(self, listener):
+        self._value_listeners.remove(listener)
+        for worker in self.workers.values():
+            worker.remove_value_listener(listener)
+
+    def remove_connection_listener(self, listener):
+        self._connection_listeners.remove(listener)
+        for worker in self.workers.values():
+            worker.remove_connection_listener(listener)
+
+    def start_monitoring(self):
+        self._monitoring = True
+        for worker in self.workers.values():
+            worker.start_monitoring()
+
+    def stop_monitoring(self):
+        self._monitoring = False
+        for worker in self.workers.values():
+            worker.stop_monitoring()
+
+    def get_characteristic_value(self, device_name, uuid):
+        return self.values.get((device_name, uuid))
+
+    def get_characteristic_statistics(self, device_name, uuid, window, field=0):
+        return self.values.statistics((device_name, uuid), window, field)
+
+    def is_connected(self, device_name=None):
+        if device_name is not None:
+            return self.devices[device_name].is_connected()
+        return all(worker.is_connected() for worker in self.workers.values())
+
+    def connected_count(self):
+        return sum(worker.connected_count() for worker in self.workers.values())
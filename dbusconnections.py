@@ -0,0 +1,65 @@
+"""
+Hands out the dbus connections used by the driver, so connections are shared wherever that is possible.
+
+Services exported with VeDbusService all publish the same object paths (/Mgmt/..., /DeviceInstance, /Connected, ...),
+and a path can only be registered once per connection. Consumers like dbusmonitor (systemcalc, vrmlogger) also identify
+a service by the unique name of its connection. So every exported sensor service needs a connection of its own.
+Everything that only talks to other services, like the settings device, shares one connection together with the
+client service, instead of each opening a connection of its own.
+"""
+import logging
+import os
+import dbus
+
+class SystemBus(dbus.bus.BusConnection):
+    def __new__(cls):
+        return dbus.bus.BusConnection.__new__(cls, dbus.bus.BusConnection.TYPE_SYSTEM)
+
+class SessionBus(dbus.bus.BusConnection):
+    def __new__(cls):
+        return dbus.bus.BusConnection.__new__(cls, dbus.bus.BusConnection.TYPE_SESSION)
+
+def dbusconnection():
+    return SessionBus() if 'DBUS_SESSION_BUS_ADDRESS' in os.environ else SystemBus()
+
+class DbusConnections:
+    def __init__(self):
+        self.logger = logging.getLogger(__name__) # create logger
+        self._shared = None
+        self._services = {}  # private connections by service name
+
+    def shared(self):
+        """
+        The connection shared by the client service and everything that only talks to other services.
+        """
+        if self._shared is None:
+            self._shared = dbusconnection()
+        return self._shared
+
+    def acquire(self, servicename):
+        """
+        Returns the private connection to export the named service on.
+        """
+        if servicename not in self._services:
+            self._services[servicename] = dbusconnection()
+        return self._services[servicename]
+
+    def release(self, servicename):
+        """
+        Releases the service name and closes the connection of a service that is no longer exported. The name is released
+        with a synchronous call first, so a service registered with the same name right after does not race the bus daemon
+        noticing the closed connection.
+        """
+        connection = self._services.pop(servicename, None)
+        if connection is not None:
+            try:
+                connection.release_name(servicename)
+            except Exception as e:
+                self.logger.error("Error releasing dbus name %s: %s", servicename, e)
+            try:
+                connection.close()
+            except Exception as e:
+                self.logger.error("Error closing dbus connection of %s: %s", servicename, e)
+
+    def count(self):
+        return len(self._services) + (1 if self._shared is not None else 0)
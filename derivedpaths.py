@@ -0,0 +1,154 @@
+"""
+Paths of a sensor service computed from other paths, e.g. the remaining volume of a tank from its level and capacity.
+
+A derived path is declared with "Derived" on the path in the sensor config:
+    inputs:     the paths the value is computed from, by argument name, e.g. {'level': '/Level', 'capacity': '/Capacity'}
+    function:   name of a function in functions below, called with the inputs as keyword arguments
+    expression: instead of a function, a python expression of the inputs, e.g. 'capacity * level / 100'. The math module
+                functions can be used
+    round:      number of decimals to round the result to (default no rounding)
+Other keys are passed to the function as keyword arguments, e.g. the 'curve' of battery_percentage.
+
+Inputs can be sensor paths, paths written by others over the dbus, like a /Capacity changed in the GUI, or other derived paths.
+All derived paths of a service are compiled at startup into a dependency graph, and a change of an input only recomputes
+the paths depending on it, in dependency order.
+"""
+import logging
+import math
+from bisect import bisect_left
+
+def remaining(level, capacity):
+    """
+    Volume left in a tank, from the level in percent and the capacity.
+    """
+    return capacity * level / 100
+
+def dew_point(temperature, humidity):
+    """
+    Dew point in degrees Celsius, from the temperature in degrees Celsius and the relative humidity in percent (Magnus formula).
+    """
+    if humidity <= 0:
+        return None
+    gamma = math.log(humidity / 100) + 17.62 * temperature / (243.12 + temperature)
+    return 243.12 * gamma / (17.62 - gamma)
+
+def battery_percentage(voltage, curve):
+    """
+    State of charge in percent, interpolated from the voltage in a curve of [voltage, percentage] points, sorted by voltage.
+    """
+    if voltage <= curve[0][0]:
+        return curve[0][1]
+    if voltage >= curve[-1][0]:
+        return curve[-1][1]
+    index = bisect_left([point[0] for point in curve], voltage)
+    (v0, p0), (v1, p1) = curve[index - 1], curve[index]
+    return p0 + (p1 - p0) * (voltage - v0) / (v1 - v0)
+
+functions = {
+    'remaining': remaining,
+    'dew_point': dew_point,
+    'battery_percentage': battery_percentage,
+}
+
+_expression_globals = {'__builtins__': {}, 'abs': abs, 'min': min, 'max': max, 'round': round}
+_expression_globals.update((name, getattr(math, name)) for name in dir(math) if not name.startswith('_'))
+
+class DerivedPath:
+    def __init__(self, path, settings):
+        settings = dict(settings)
+        self.path = path
+        self.inputs = settings.pop('inputs')    # input path by argument name
+        self.digits = settings.pop('round', None)
+        if 'expression' in settings:
+            code = compile(settings.pop('expression'), path, 'eval')
+            if settings:
+                raise ValueError("Unknown settings for derived path %s: %s" % (path, ', '.join(settings)))
+            self._compute = lambda **arguments: eval(code, _expression_globals, arguments)
+        elif settings.get('function') in functions:
+            function = functions[settings.pop('function')]
+            self._compute = lambda **arguments: function(**arguments, **settings)
+        else:
+            raise ValueError("Derived path %s needs an expression or one of the functions %s" % (path, ', '.join(functions)))
+
+    def compute(self, values):
+        """
+        Returns the value computed from the values of the inputs, or None if an input has no value.
+        """
+        arguments = {}
+        for name, path in self.inputs.items():
+            value = values(path)
+            if value is None or value == []:    # vedbus invalid value
+                return None
+            arguments[name] = value
+        value = self._compute(**arguments)
+        if value is not None and self.digits is not None:
+            value = round(value, self.digits)
+        return value
+
+class DerivedPaths:
+    """
+    The derived paths of one service, in dependency order.
+    """
+    def __init__(self, paths):
+        derived = {path: DerivedPath(path, settings["Derived"]) for path, settings in paths.items() if "Derived" in settings}
+        for output in derived.values():
+            for path in output.inputs.values():
+                if path not in paths:
+                    raise ValueError("Input %s of derived path %s does not exist" % (path, output.path))
+
+        self.order = []     # derived paths, each after the derived paths it reads
+        visiting = set()
+        def visit(output):
+            if output in self.order:
+                return
+            if output in visiting:
+                raise ValueError("Derived path %s depends on itself" % output.path)
+            visiting.add(output)
+            for path in output.inputs.values():
+                if path in derived:
+                    visit(derived[path])
+            visiting.discard(output)
+            self.order.append(output)
+        for output in derived.values():
+            visit(output)
+
+        self._dependents = {}   # derived paths to recompute when a path changes, in dependency order, by path
+        for path in paths:
+            affected = set()
+            changed = {path}
+            for output in self.order:
+                if changed.intersection(output.inputs.values()):
+                    affected.add(output)
+                    changed.add(output.path)
+            if affected:
+                self._dependents[path] = [output for output in self.order if output in affected]
+        self._last = {}     # input values last computed with, by path
+
+    def __bool__(self):
+        return bool(self.order)
+
+    def update(self, changes, read):
+        """
+        Recomputes the derived paths depending on the changed paths, reading the other inputs with read(path).
+        changes are the new values by path. Returns the derived values by path.
+        """
+        outputs = []
+        for path, value in changes.items():
+            if path in self._dependents and self._last.get(path) != value:
+                self._last[path] = value
+                outputs.extend(self._dependents[path])
+        if not outputs:
+            return {}
+        values = dict(changes)
+        lookup = lambda path: values[path] if path in values else read(path)
+        derived = {}
+        for output in self.order:
+            if output in outputs:
+                try:
+                    value = output.compute(lookup)
+                except Exception as e:
+                    logging.error("Error computing derived path %s: %s", output.path, e)
+                    continue
+                if value is not None:
+                    values[output.path] = derived[output.path] = value
+        return derived
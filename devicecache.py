@@ -0,0 +1,53 @@
+"""
+Small persistent cache of what is known about the BLE server devices, e.g. the last known address.
+It lets the client reconnect directly to a device without scanning for it first.
+The cache is stored as json, written with atomic_write_json.
+"""
+import json
+import logging
+import os
+from atomicwrite import atomic_write_json
+
+class DeviceCache:
+    def __init__(self, filename):
+        self.logger = logging.getLogger(__name__) # create logger
+        self.filename = filename
+        self.devices = {}   # cached entries by device name
+        self._load()
+
+    def _load(self):
+        if self.filename is None or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename) as f:
+                self.devices = json.load(f)
+        except Exception as e:
+            self.logger.warning("Could not read device cache %s: %s", self.filename, e)
+            self.devices = {}
+
+    def _save(self):
+        if self.filename is None:
+            return
+        try:
+            atomic_write_json(self.filename, self.devices)
+        except Exception as e:
+            self.logger.warning("Could not write device cache %s: %s", self.filename, e)
+
+    def get(self, device_name, key):
+        return self.devices.get(device_name, {}).get(key)
+
+    def set(self, device_name, key, value):
+        """
+        Stores a value for a device. The file is only written when the value changed.
+        """
+        entry = self.devices.setdefault(device_name, {})
+        if entry.get(key) == value:
+            return
+        entry[key] = value
+        self._save()
+
+    def remove(self, device_name, key):
+        entry = self.devices.get(device_name, {})
+        if key in entry:
+            del entry[key]
+            self._save()
@@ -0,0 +1,206 @@
+"""
+Simulated BLE backend, used in place of bleak to run the client without Bluetooth hardware.
+It provides BleakScanner and BleakClient look-alikes serving simulated peripherals with scripted or generated
+notification streams, configurable notification rates, scan time, connect latency, connect failures and random disconnects.
+
+Usage:
+    backend = FakeBackend([FakePeripheral("ESP32 BLE Sensor Server", [FakeCharacteristic(uuid, rate=10)])])
+    client = SensorBLEClient(devices, backend=backend)
+"""
+import asyncio
+import random
+import struct
+import time
+
+class FakeCharacteristic:
+    """
+    A characteristic of a simulated peripheral.
+    rate: notifications per second, generated with payload. 0 for no generated notifications.
+    payload: function returning the bytes of the next value. Defaults to the current time.perf_counter() as a little endian double,
+             so a receiver can measure the latency of the notification.
+    script: list of (delay in seconds, bytes) notifications played once after subscribing, before the generated ones.
+    """
+    def __init__(self, uuid, rate=0, payload=None, script=None, service_uuid='0000fff0-0000-1000-8000-00805f9b34fb', properties=('read', 'notify')):
+        self.uuid = uuid
+        self.rate = rate
+        self.payload = payload if payload is not None else perf_counter_payload
+        self.script = script if script is not None else []
+        self.service_uuid = service_uuid
+        self.properties = list(properties)
+        self.sent = 0   # notifications sent
+
+_double = struct.Struct('<d')
+
+def perf_counter_payload():
+    return bytearray(_double.pack(time.perf_counter()))
+
+class FakePeripheral:
+    """
+    A simulated BLE server device.
+    disconnect_rate: mean number of random disconnects per second while connected.
+    connect_failure_rate: probability of a connection attempt failing.
+    """
+    def __init__(self, name, characteristics, address=None, disconnect_rate=0, connect_failure_rate=0, visible=True):
+        self.name = name
+        self.address = address if address is not None else "FA:KE:%02X:%02X:%02X:%02X" % tuple(random.randrange(256) for i in range(4))
+        self.characteristics = {characteristic.uuid: characteristic for characteristic in characteristics}
+        self.disconnect_rate = disconnect_rate
+        self.connect_failure_rate = connect_failure_rate
+        self.visible = visible  # found by scans and reachable
+        self.disconnects = []   # time.perf_counter() of every simulated disconnect
+
+class FakeBackend:
+    """
+    Provides BleakScanner and BleakClient for the simulated peripherals.
+    scan_time and connect_latency are in seconds.
+    """
+    def __init__(self, peripherals, scan_time=0.5, connect_latency=0.1, seed=None):
+        self.peripherals = {peripheral.name: peripheral for peripheral in peripherals}
+        self.scan_time = scan_time
+        self.connect_latency = connect_latency
+        self.random = random.Random(seed)
+        self.BleakScanner = FakeBleakScanner(self)
+        self.scans = 0
+        self.connects = 0
+        self.resets = 0
+        self.clients = []   # clients created on this adapter, dropped when it is reset
+
+    def BleakClient(self, device, services=None, timeout=10, disconnected_callback=None, **kwargs):
+        client = FakeBleakClient(self, device, disconnected_callback)
+        self.clients = [client for client in self.clients if client.is_connected] + [client]
+        return client
+
+    def find_peripheral(self, address):
+        for peripheral in self.peripherals.values():
+            if peripheral.address == address and peripheral.visible:
+                return peripheral
+        return None
+
+    async def reset_adapter(self):
+        """
+        Power cycles the simulated adapter, which drops every connection through it like a real reset does.
+        """
+        self.resets += 1
+        for client in self.clients:
+            client._drop()
+        self.clients = []
+        await asyncio.sleep(self.connect_latency)
+
+class FakeDevice:
+    def __init__(self, peripheral):
+        self.name = peripheral.name
+        self.address = peripheral.address
+
+class FakeBleakScanner:
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def find_device_by_name(self, name, timeout=10.0, **kwargs):
+        self.backend.scans += 1
+        peripheral = self.backend.peripherals.get(name)
+        if peripheral is None or not peripheral.visible:
+            await asyncio.sleep(min(timeout, self.backend.scan_time * 4))  # scanned until the timeout without finding it
+            return None
+        await asyncio.sleep(self.backend.scan_time)
+        return FakeDevice(peripheral)
+
+class FakeServices:
+    def __init__(self, peripheral):
+        self.peripheral = peripheral
+
+    def get_characteristic(self, uuid):
+        return self.peripheral.characteristics.get(uuid) if self.peripheral is not None else None
+
+class FakeBleakClient:
+    def __init__(self, backend, device, disconnected_callback):
+        self.backend = backend
+        self.address = device if isinstance(device, str) else device.address
+        self.disconnected_callback = disconnected_callback
+        self.peripheral = None
+        self.services = FakeServices(None)
+        self.is_connected = False
+        self._tasks = []
+        self._notify_tasks = {}  # notification task by uuid
+
+    async def connect(self, **kwargs):
+        self.backend.connects += 1
+        await asyncio.sleep(self.backend.connect_latency)
+        peripheral = self.backend.find_peripheral(self.address)
+        if peripheral is None or self.backend.random.random() < peripheral.connect_failure_rate:
+            raise Exception("Device with address %s was not found" % self.address)
+        self.peripheral = peripheral
+        self.services = FakeServices(peripheral)
+        self.is_connected = True
+        if peripheral.disconnect_rate > 0:
+            self._tasks.append(asyncio.ensure_future(self._random_disconnect()))
+        return True
+
+    async def disconnect(self):
+        self._drop()
+        return True
+
+    async def start_notify(self, uuid, callback):
+        characteristic = self._characteristic(uuid)
+        if 'notify' not in characteristic.properties:
+            raise Exception("Characteristic %s does not support notify" % uuid)
+        task = asyncio.ensure_future(self._notify(characteristic, callback))
+        self._tasks.append(task)
+        self._notify_tasks[uuid] = task
+
+    async def stop_notify(self, uuid):
+        self._characteristic(uuid)
+        task = self._notify_tasks.pop(uuid, None)
+        if task is not None:
+            task.cancel()
+
+    async def read_gatt_char(self, characteristic):
+        uuid = characteristic if isinstance(characteristic, str) else characteristic.uuid
+        characteristic = self._characteristic(uuid)
+        await asyncio.sleep(0.005)  # a read round trip
+        return characteristic.payload()
+
+    def _characteristic(self, uuid):
+        if not self.is_connected:
+            raise Exception("Not connected")
+        if uuid not in self.peripheral.characteristics:
+            raise Exception("Characteristic %s was not found!" % uuid)
+        return self.peripheral.characteristics[uuid]
+
+    async def _notify(self, characteristic, callback):
+        for delay, data in characteristic.script:
+            await asyncio.sleep(delay)
+            characteristic.sent += 1
+            callback(characteristic, bytearray(data))
+        if characteristic.rate <= 0:
+            return
+        # send in ticks of at least 5 ms, with several notifications per tick at high rates
+        tick = max(1 / characteristic.rate, 0.005)
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        owed = 0.0
+        while self.is_connected:
+            next_tick += tick
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            owed += characteristic.rate * tick
+            while owed >= 1 and self.is_connected:
+                owed -= 1
+                characteristic.sent += 1
+                callback(characteristic, characteristic.payload())
+
+    async def _random_disconnect(self):
+        await asyncio.sleep(self.backend.random.expovariate(self.peripheral.disconnect_rate))
+        if self.is_connected:
+            self.peripheral.disconnects.append(time.perf_counter())
+            self._drop()
+
+    def _drop(self):
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        for task in self._tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self._tasks = []
+        self._notify_tasks = {}
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
@@ -0,0 +1,79 @@
+"""
+Runs an asyncio event loop on the GLib main loop, so the BLE client and the dbus services share a single thread.
+
+With PyGObject 3.50 or later gi.events provides an asyncio event loop running on the GLib main context, which is used when available.
+Otherwise a standard asyncio loop is attached to the GLib main context as a GLib source: GLib polls the epoll fd of the
+asyncio selector along with its own fds, wakes up when the first asyncio timer is due, and runs one iteration of the asyncio
+loop when there is something to do. That relies on private attributes of asyncio.BaseEventLoop, which are checked before use
+and have been stable up to the last tested Python version.
+"""
+import asyncio
+import logging
+import math
+import sys
+from gi.repository import GLib
+
+tested_python = (3, 13)   # last Python version the private asyncio attributes used by AsyncioSource were checked with
+_loop_internals = ('_ready', '_scheduled', '_selector')
+
+try:
+    from gi.events import GLibEventLoopPolicy
+except ImportError:
+    GLibEventLoopPolicy = None
+
+class AsyncioSource(GLib.Source):
+    """
+    GLib source running an asyncio selector event loop. It uses the _ready and _scheduled queues of asyncio.BaseEventLoop
+    to know when the loop has callbacks to run, since asyncio has no public api for that.
+    """
+    def __init__(self, loop):
+        missing = [name for name in _loop_internals if not hasattr(loop, name)]
+        if missing:
+            raise RuntimeError("Can not run asyncio on the GLib main loop: the event loop of Python %d.%d has no %s. Install PyGObject 3.50 or later to use gi.events instead"
+                               % (sys.version_info[0], sys.version_info[1], ', '.join(missing)))
+        if sys.version_info[:2] > tested_python:
+            logging.warning("Running asyncio on the GLib main loop with Python %d.%d, newer than the last tested %d.%d", sys.version_info[0], sys.version_info[1], *tested_python)
+        super().__init__()
+        self.loop = loop
+        self._fd = self.add_unix_fd(loop._selector.fileno(), GLib.IOCondition.IN)
+        self.set_name("asyncio")
+
+    def _timeout(self):
+        """
+        Returns the seconds until the asyncio loop has callbacks to run, or None if it only waits for I/O.
+        """
+        if self.loop._ready:
+            return 0
+        if self.loop._scheduled:
+            return max(0, self.loop._scheduled[0].when() - self.loop.time())
+        return None
+
+    def prepare(self):
+        timeout = self._timeout()
+        if timeout is None:
+            return False, -1
+        return timeout == 0, int(math.ceil(timeout * 1000))
+
+    def check(self):
+        return self._timeout() == 0 or bool(self.query_unix_fd(self._fd) & GLib.IOCondition.IN)
+
+    def dispatch(self, callback, args):
+        if not self.loop.is_running() and not self.loop.is_closed():   # not when the loop is run to completion on stopping
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()    # runs one iteration: the I/O events, the due timers and the ready callbacks
+        return GLib.SOURCE_CONTINUE
+
+def glib_event_loop():
+    """
+    Returns an asyncio event loop that runs while the GLib main loop runs.
+    """
+    if GLibEventLoopPolicy is not None:
+        policy = GLibEventLoopPolicy()
+        asyncio.set_event_loop_policy(policy)
+        logging.info("Running asyncio on the GLib main loop with gi.events")
+        return policy.get_event_loop()
+    loop = asyncio.SelectorEventLoop()
+    asyncio.set_event_loop(loop)
+    AsyncioSource(loop).attach(GLib.MainContext.default())
+    logging.info("Running asyncio on the GLib main loop through its selector fd")
+    return loop
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Queries the history recorded by the BLE Sensor Client, see historyrecorder.py.
+
+Commands:
+- channels:   lists the recorded channels
+- range:      prints the records of channels in a time range
+- downsample: prints count, min, max, mean and last value per interval
+- aggregate:  prints count, min, max, mean and last value over the whole time range
+
+Times are given as seconds since the epoch, an ISO date and time like 2024-06-01T12:00, or relative to now like --start=-2h or --start=-30d.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from historyrecorder import HistoryReader
+
+_units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+def parse_time(text):
+    if text is None:
+        return None
+    if text.startswith('-') and text[-1] in _units:
+        return time.time() - float(text[1:-1]) * _units[text[-1]]
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def parse_interval(text):
+    if text[-1] in _units:
+        return float(text[:-1]) * _units[text[-1]]
+    return float(text)
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='seconds') if timestamp is not None else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the history recorded by the BLE Sensor Client")
+    parser.add_argument("--directory", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history'), help="history directory")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("channels", help="list the recorded channels")
+    for name, help in (("range", "print the records in a time range"), ("downsample", "aggregate the records per interval"), ("aggregate", "aggregate the records in a time range")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("channel", nargs='*', help="channel id, or part of a device name, uuid or dbus path. All channels if omitted")
+        command.add_argument("--start", help="start of the time range")
+        command.add_argument("--end", help="end of the time range")
+        if name == "downsample":
+            command.add_argument("--interval", default='1h', help="length of the intervals, e.g. 900, 15m or 1d")
+    args = parser.parse_args()
+
+    reader = HistoryReader(args.directory)
+    if args.command == "channels":
+        if args.json:
+            print(json.dumps(reader.channels))
+            return
+        for channel in reader.channels:
+            print("%4d  %s  %s  field %d  %s" % (channel['id'], channel['device'], channel['uuid'], channel['field'], ', '.join(channel['paths'])))
+        return
+
+    channels = None
+    if args.channel:
+        channels = [id for pattern in args.channel for id in reader.find_channels(pattern)]
+        if not channels:
+            sys.exit("No channel matches %s" % ', '.join(args.channel))
+    start = parse_time(args.start)
+    end = parse_time(args.end)
+
+    if args.command == "range":
+        for timestamp, id, value in reader.records(channels, start, end):
+            if args.json:
+                print(json.dumps([timestamp, id, value]))
+            else:
+                print("%s  %4d  %g" % (format_time(timestamp), id, value))
+        return
+
+    results = reader.aggregate(channels, start, end, parse_interval(args.interval) if args.command == "downsample" else None)
+    if args.json:
+        print(json.dumps(results))
+        return
+    for id, buckets in sorted(results.items()):
+        print("channel %d" % id)
+        for bucket in buckets:
+            print("  %-19s  count %6d  min %10g  max %10g  mean %10g  last %10g" % (format_time(bucket['start']) or '', bucket['count'], bucket['min'], bucket['max'], bucket['mean'], bucket['last']))
+
+if __name__ == "__main__":
+    main()
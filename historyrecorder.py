@@ -0,0 +1,279 @@
+"""
+Local history of the sensor readings, independent of VRM.
+
+The recorder is fed from the notification path of the BLE client and appends a fixed size record per reading:
+    timestamp (float64 seconds since the epoch), channel id (uint32), value (float32)
+to segment files of segment_records records each. When max_segments segments exist the oldest is removed, so the history
+never takes more than max_segments * segment_records * 16 bytes of disk.
+A channel is one field of a characteristic; channels.json in the history directory holds the channel ids with their
+device, uuid, field and the dbus paths publishing them.
+
+A channel is recorded when its value changed, at most once per interval seconds. A change arriving sooner is held back,
+and the latest held back value is recorded once the interval expired, so the history always ends at the current value.
+Records are collected in a preallocated buffer and written in batches, so the SD card sees few large writes and memory
+use is bounded by the buffer. The writing is driven by calling tick() from a main loop timer, so the notification path
+does no disk I/O unless the buffer fills up between two ticks.
+
+HistoryReader memory-maps the segments for queries, see history-blesensorclient.py.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from threading import Lock
+from atomicwrite import atomic_write_json
+
+record_struct = struct.Struct('<dIf')
+segment_suffix = '.seg'
+
+def _segment_name(number):
+    return 'segment-%08d%s' % (number, segment_suffix)
+
+def _segment_numbers(directory):
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith('segment-') and name.endswith(segment_suffix):
+            try:
+                numbers.append(int(name[len('segment-'):-len(segment_suffix)]))
+            except ValueError:
+                pass
+    return sorted(numbers)
+
+def _channel_name(key, field):
+    return '%s|%s|%d' % (key[0], key[1], field)
+
+class HistoryRecorder:
+    def __init__(self, directory, labels=None, interval=10, segment_records=65536, max_segments=256, buffer_records=4096, flush_interval=60):
+        self.logger = logging.getLogger(__name__) # create logger
+        self.directory = directory
+        self.labels = labels or {}  # dbus paths publishing a field, by (device name, uuid, field index)
+        self.interval = interval
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.Lock = Lock()
+        self._buffer = bytearray(buffer_records * record_struct.size)
+        self._buffered = 0
+        self._flushed_at = time.monotonic()
+        self._last = {}     # (timestamp, value) last recorded by channel id
+        self._held = {}     # (timestamp, value) changed within the interval and not recorded yet, by channel id
+        self.records = 0
+        self.flushes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._channels_file = os.path.join(directory, 'channels.json')
+        self._channels = {}     # channel id by channel name
+        self._fields = {}       # channel ids of the fields by (device name, uuid)
+        self._load_channels()
+        numbers = _segment_numbers(directory)
+        self._segment = numbers[-1] if numbers else 0
+        self._segment_size = os.path.getsize(self._segment_path(self._segment)) if numbers else 0
+        self._segment_size -= self._segment_size % record_struct.size    # a record cut off by a power loss is overwritten
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, _segment_name(number))
+
+    def _load_channels(self):
+        if not os.path.exists(self._channels_file):
+            return
+        try:
+            with open(self._channels_file) as f:
+                for channel in json.load(f):
+                    self._channels[channel['name']] = channel['id']
+        except Exception as e:
+            self.logger.warning("Could not read history channels %s: %s", self._channels_file, e)
+
+    def _save_channels(self):
+        channels = []
+        for name, id in sorted(self._channels.items(), key=lambda item: item[1]):
+            device, uuid, field = name.rsplit('|', 2)
+            channels.append({'id': id, 'name': name, 'device': device, 'uuid': uuid, 'field': int(field), 'paths': self.labels.get((device, uuid, int(field)), [])})
+        atomic_write_json(self._channels_file, channels, indent=1)
+
+    def _channel_ids(self, key, width):
+        ids = self._fields.get(key)
+        if ids is None or len(ids) != width:
+            ids = []
+            for field in range(width):
+                name = _channel_name(key, field)
+                if name not in self._channels:
+                    self._channels[name] = len(self._channels)
+                    self._save_channels()
+                ids.append(self._channels[name])
+            self._fields[key] = ids
+        return ids
+
+    def record(self, key, timestamp, record):
+        """
+        Records the fields of a decoded record of a characteristic that changed since they were last recorded.
+        """
+        if not isinstance(record, tuple):
+            return  # undecoded bytes are not recorded
+        with self.Lock:
+            try:
+                for id, value in zip(self._channel_ids(key, len(record)), record):
+                    last = self._last.get(id)
+                    if last is not None and last[1] == value:
+                        self._held.pop(id, None)    # back at the recorded value
+                    elif last is not None and timestamp - last[0] < self.interval:
+                        self._held[id] = (timestamp, value)
+                    else:
+                        self._held.pop(id, None)
+                        self._append(timestamp, id, value)
+            except Exception as e:
+                self.logger.error("Error recording history of characteristic %s: %s", key[1], e)
+
+    def _append(self, timestamp, id, value):
+        self._last[id] = (timestamp, value)
+        record_struct.pack_into(self._buffer, self._buffered * record_struct.size, timestamp, id, value)
+        self._buffered += 1
+        self.records += 1
+        if self._buffered * record_struct.size == len(self._buffer):
+            self._flush()   # only when the buffer fills up between two ticks
+
+    def _record_held(self, now, all=False):
+        """
+        Records the held back values whose interval expired, or all of them. They are recorded at now, when they are still
+        the current value, which keeps the records in time order.
+        """
+        for id, (timestamp, value) in list(self._held.items()):
+            if all or now - self._last[id][0] >= self.interval:
+                del self._held[id]
+                self._append(now, id, value)
+
+    def tick(self):
+        """
+        Called periodically from the main loop: records the held back values that are due, and writes the buffer every
+        flush_interval seconds. Returns True to keep a GLib timer running.
+        """
+        with self.Lock:
+            try:
+                self._record_held(time.time())
+                if self._buffered and time.monotonic() - self._flushed_at >= self.flush_interval:
+                    self._flush()
+            except Exception as e:
+                self.logger.error("Error writing history: %s", e)
+        return True
+
+    def flush(self):
+        """
+        Writes everything, also the held back values, e.g. on exit.
+        """
+        with self.Lock:
+            self._record_held(time.time(), all=True)
+            self._flush()
+
+    def _flush(self):
+        """
+        Appends the buffered records to the current segment, continuing in a new segment when it is full.
+        """
+        self._flushed_at = time.monotonic()
+        start = 0
+        while start < self._buffered:
+            free = self.segment_records - self._segment_size // record_struct.size
+            if free <= 0:
+                self._rotate()
+                continue
+            count = min(free, self._buffered - start)
+            with open(self._segment_path(self._segment), 'r+b' if self._segment_size else 'wb') as f:
+                f.seek(self._segment_size)
+                f.write(memoryview(self._buffer)[start * record_struct.size:(start + count) * record_struct.size])
+            self._segment_size += count * record_struct.size
+            start += count
+        self._buffered = 0
+        self.flushes += 1
+
+    def _rotate(self):
+        self._segment += 1
+        self._segment_size = 0
+        numbers = _segment_numbers(self.directory)
+        for number in numbers[:max(0, len(numbers) + 1 - self.max_segments)]:
+            os.remove(self._segment_path(number))
+
+class HistoryReader:
+    """
+    Queries the history in a directory written by a HistoryRecorder. Segments are memory-mapped, and searched by timestamp
+    with a binary search, so a query only touches the part of the history in its time range.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'channels.json')) as f:
+            self.channels = json.load(f)
+
+    def find_channels(self, pattern):
+        """
+        Returns the ids of the channels with the pattern in their id, device, uuid or one of their paths.
+        """
+        return [channel['id'] for channel in self.channels
+                if pattern == str(channel['id']) or any(pattern in text for text in [channel['device'], channel['uuid']] + channel['paths'])]
+
+    def records(self, channels=None, start=None, end=None):
+        """
+        Yields (timestamp, channel id, value) of the channels in the time range, oldest first.
+        """
+        channels = set(channels) if channels is not None else None
+        for number in _segment_numbers(self.directory):
+            path = os.path.join(self.directory, _segment_name(number))
+            size = os.path.getsize(path)
+            size -= size % record_struct.size
+            if size == 0:
+                continue
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                count = size // record_struct.size
+                if start is not None and self._timestamp(data, count - 1) < start:
+                    continue
+                if end is not None and self._timestamp(data, 0) > end:
+                    break
+                first = self._search(data, count, start) if start is not None else 0
+                last = self._search(data, count, end, after=True) if end is not None else count
+                view = memoryview(data)[first * record_struct.size:last * record_struct.size]
+                try:
+                    for sample in record_struct.iter_unpack(view):
+                        if channels is None or sample[1] in channels:
+                            yield sample
+                finally:
+                    view.release()
+
+    def _timestamp(self, data, index):
+        return record_struct.unpack_from(data, index * record_struct.size)[0]
+
+    def _search(self, data, count, timestamp, after=False):
+        """
+        Returns the index of the first record at or, with after, past the timestamp.
+        """
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            value = self._timestamp(data, middle)
+            if value < timestamp or (after and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def aggregate(self, channels=None, start=None, end=None, interval=None):
+        """
+        Returns {channel id: [bucket]} with a bucket per interval seconds, or one bucket for the whole range without interval.
+        A bucket is a dict with the start, count, min, max, mean and last value.
+        """
+        results = {}
+        current = {}
+        for timestamp, id, value in self.records(channels, start, end):
+            bucket_start = timestamp - timestamp % interval if interval else start
+            bucket = current.get(id)
+            if bucket is None or bucket['start'] != bucket_start:
+                bucket = current[id] = {'start': bucket_start, 'count': 0, 'min': value, 'max': value, 'sum': 0.0, 'last': value}
+                results.setdefault(id, []).append(bucket)
+            bucket['count'] += 1
+            bucket['sum'] += value
+            bucket['last'] = value
+            if value < bucket['min']:
+                bucket['min'] = value
+            elif value > bucket['max']:
+                bucket['max'] = value
+        for buckets in results.values():
+            for bucket in buckets:
+                bucket['mean'] = bucket.pop('sum') / bucket['count']
+        return results
@@ -0,0 +1,122 @@
+"""
+Publish policies deciding which value updates are written to the dbus.
+
+Each path keeps a local shadow copy of the value last published, so unchanged values never touch VeDbusService.
+Numeric paths can additionally be configured with "Publish" in the sensor config:
+    deadband:          absolute change below which a new value is not published
+    relative_deadband: change relative to the published value below which a new value is not published, e.g. 0.01 for 1%
+    min_interval:      minimum seconds between two publishes. A value arriving earlier is published when the interval has passed
+    heartbeat:         maximum seconds a value held back by the deadband stays unpublished
+Values held back by the minimum interval, or by the deadband when a heartbeat is set, are published by a timer.
+"""
+import time
+
+class PublishPolicy:
+    def __init__(self, deadband=0, relative_deadband=0, min_interval=0, heartbeat=None):
+        for name, value in (('deadband', deadband), ('relative_deadband', relative_deadband), ('min_interval', min_interval), ('heartbeat', heartbeat)):
+            if value is None and name == 'heartbeat':
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError("%s must be a number of at least 0, not %r" % (name, value))
+        self.deadband = deadband
+        self.relative_deadband = relative_deadband
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+
+    def within_deadband(self, published, value):
+        if not isinstance(value, (int, float)) or not isinstance(published, (int, float)):
+            return False
+        return abs(value - published) <= max(self.deadband, self.relative_deadband * abs(published))
+
+default_policy = PublishPolicy()
+
+class Publisher:
+    """
+    Publishes the values of one VeDbusService through the policies of its paths.
+    schedule is called with (delay in seconds, callback) to run a callback later on the main loop.
+    """
+    def __init__(self, dbusservice, policies, schedule, on_write=None, on_suppress=None):
+        self._dbusservice = dbusservice
+        self._policies = policies   # PublishPolicy by path, paths without one only suppress unchanged values
+        self._schedule = schedule
+        self._on_write = on_write
+        self._on_suppress = on_suppress
+        self._shadow = {}       # values last published, by path
+        self._published_at = {} # time.monotonic() of the last publish, by path
+        self._pending = {}      # values held back, by path
+        self._scheduled = set() # paths with a timer running to publish the held back value
+        self._closed = False
+
+    def get(self, path):
+        """
+        Returns the value last published on a path, without reading from the dbus service.
+        """
+        return self._shadow.get(path)
+
+    def set_shadow(self, path, value):
+        """
+        Records a value that is already on the dbus, e.g. the initial value or a value written by someone else.
+        It counts as published now, so the next value is held to the deadband and minimum interval like any other.
+        """
+        self._shadow[path] = value
+        self._published_at[path] = time.monotonic()
+        self._pending.pop(path, None)
+
+    def publish(self, path, value):
+        """
+        Publishes a value if the policy of the path allows it now, otherwise holds it back. Returns True if it was written.
+        """
+        if self._closed or (path in self._shadow and self._shadow[path] == value):
+            self._pending.pop(path, None)
+            return False
+        policy = self._policies.get(path, default_policy)
+        if policy is default_policy:
+            return self._write(path, value)
+        now = time.monotonic()
+        since = now - self._published_at.get(path, float('-inf'))
+        if path in self._shadow and policy.within_deadband(self._shadow[path], value):
+            if policy.heartbeat is None or since < policy.heartbeat:
+                self._hold(path, value, policy.heartbeat - since if policy.heartbeat is not None else None)
+                return False
+        if since < policy.min_interval:
+            self._hold(path, value, policy.min_interval - since)
+            return False
+        return self._write(path, value)
+
+    def write(self, path, value):
+        """
+        Publishes a value right away regardless of the policy, e.g. a last known value seeded on startup. Returns True if it was written.
+        """
+        if self._closed or (path in self._shadow and self._shadow[path] == value):
+            return False
+        return self._write(path, value)
+
+    def _write(self, path, value):
+        self._dbusservice[path] = value
+        self._shadow[path] = value
+        self._published_at[path] = time.monotonic()
+        self._pending.pop(path, None)
+        if self._on_write is not None:
+            self._on_write()
+        return True
+
+    def _hold(self, path, value, delay):
+        self._pending[path] = value
+        if self._on_suppress is not None:
+            self._on_suppress()
+        if delay is not None and path not in self._scheduled:
+            self._scheduled.add(path)
+            self._schedule(delay, lambda: self._flush(path))
+
+    def close(self):
+        """
+        Drops the held back values, for a dbus service that is removed. Timers still running do nothing.
+        """
+        self._closed = True
+        self._pending.clear()
+
+    def _flush(self, path):
+        self._scheduled.discard(path)
+        if path in self._pending:
+            self.publish(path, self._pending.pop(path))
+        return False    # run once
@@ -0,0 +1,68 @@
+"""
+Polls the characteristics that can not notify, inside the asyncio loop of the BLE client.
+Each characteristic has a configured read interval. Reads falling due within a short slack of each other are
+issued together, and the interval adapts to the values read: it backs off while a value does not change,
+and speeds up again when it does, within a factor of the configured interval.
+"""
+import asyncio
+import heapq
+import logging
+
+class ReadScheduler:
+    def __init__(self, intervals, min_factor=0.5, max_factor=4, slack=0.5, max_concurrent_reads=4):
+        """
+        intervals: dict of {uuid: read interval in seconds}
+        min_factor, max_factor: range of the adapted interval, relative to the configured interval
+        slack: seconds a read may be issued early, to batch it with other reads falling due
+        max_concurrent_reads: reads in flight at the same time, so the notifications keep flowing
+        """
+        self.logger = logging.getLogger(__name__) # create logger
+        for uuid, interval in intervals.items():
+            if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+                raise ValueError("Read interval of %s must be a positive number of seconds, not %r" % (uuid, interval))
+        self.intervals = dict(intervals)   # configured intervals
+        self.current = dict(intervals)     # adapted intervals
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.slack = slack
+        self.max_concurrent_reads = max_concurrent_reads
+        self._last = {}  # last value read by uuid
+
+    async def run(self, read):
+        """
+        Reads the characteristics until cancelled. read is a coroutine function taking a uuid and returning the value read.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrent_reads)
+        now = loop.time()
+        queue = [(now, uuid) for uuid in self.intervals] # (due time, uuid), all read right away
+        heapq.heapify(queue)
+        while queue:
+            now = loop.time()
+            slack = min(self.slack, min(self.current.values()) / 4)  # never read a characteristic much earlier than its interval
+            due = []
+            while queue and queue[0][0] <= now + slack:
+                due.append(heapq.heappop(queue)[1])
+            if due:
+                await asyncio.gather(*(self._read(read, uuid, semaphore) for uuid in due))
+                now = loop.time()
+                for uuid in due:
+                    heapq.heappush(queue, (now + self.current[uuid], uuid))
+            await asyncio.sleep(max(queue[0][0] - loop.time(), 0))
+
+    async def _read(self, read, uuid, semaphore):
+        async with semaphore:
+            try:
+                value = await read(uuid)
+            except Exception as e:
+                self.logger.debug("Could not read characteristic %s: %s", uuid, e)
+                return
+        self._adapt(uuid, value)
+
+    def _adapt(self, uuid, value):
+        interval = self.intervals[uuid]
+        if uuid in self._last and self._last[uuid] == value:
+            self.current[uuid] = min(self.current[uuid] * 1.5, interval * self.max_factor)   # back off while unchanged
+        else:
+            self.current[uuid] = max(self.current[uuid] / 2, interval * self.min_factor)     # speed up while changing
+        self._last[uuid] = value
@@ -1,43 +1,182 @@
 """
-This class is a BLE client that connects to and read values from a BLE server. 
-It runs in a separate thread and continuously monitors the connection to the server and updates values from the server when notified.
+This class is a BLE client that connects to and read values from one or more BLE servers.
+It runs in a separate thread, or on an asyncio loop shared with the consumer, and continuously monitors the connection to each server and updates values from the servers when notified.
+All devices are handled concurrently in the same asyncio loop, so a slow or missing device does not delay the others.
+Changed values are either read on demand with get_characteristic_value, or pushed to registered value listeners.
+Bursts of notifications are coalesced into a single dispatch on the consumers main loop.
+Characteristics are identified by (device name, uuid) since several devices may run the same firmware.
+Values are decoded to numbers in the BLE thread by the decoder of the characteristic, so consumers only receive ready values.
+Decoded values are kept in a ValueStore with the latest value and a ring buffer of recent samples per characteristic,
+which is read without locking.
+Lost connections are recovered inside the running process: the last known address of each device is connected to directly,
+a scan is only done when that fails, and retries back off exponentially with jitter. The Bluetooth adapter is only reset
+after a configurable number of consecutive failures, and only when no device is connected through it.
+On connect all characteristics are subscribed to concurrently, and the GATT services holding them are cached per address,
+so reconnects only discover those services and reuse the services bleak discovered before.
+Characteristics that can not notify are polled by a ReadScheduler while the device is connected.
+The connection state of each device is tracked from the disconnected callback of bleak and the results of the connection
+attempts, and every transition is published to the connection listeners. Nothing is polled while the devices are connected.
+The BLE backend is pluggable: bleak is imported when monitoring starts without a backend, so a disabled client never
+loads it, and a simulated backend (see fakeble.py) can be passed in to run without Bluetooth hardware.
+Runtime statistics (notification rates, dispatch delays, reconnects, scan times) are recorded in a SensorStats.
+Changed values can be recorded in a local history by a HistoryRecorder, see historyrecorder.py.
 """
 import asyncio
 from datetime import datetime
+from functools import partial
 from threading import Thread, Lock
+from contextlib import nullcontext
 import logging
-import subprocess
-from bleak import BleakClient, BleakScanner, BleakGATTCharacteristic
+import random
+import time
+from devicecache import DeviceCache
+from valuestore import ValueStore
+from readscheduler import ReadScheduler
+from sensorstats import SensorStats
 
 class SensorBLEClient:
-    def __init__(self, target_device_name, characteristic_uuids, mainloop):
-        self.mainloop = mainloop
+    def __init__(self, devices, dispatcher=None, decoders=None, read_intervals=None, history_size=256, cache_file=None, reset_after_failures=5, min_backoff=1, max_backoff=60, connect_timeout=10, backend=None, stats=None, recorder=None, loop=None, adapter=None, values=None):
+        """
+        devices: dict of {device name: [characteristic uuids]} to connect to and subscribe to.
+        decoders: dict of {(device name, uuid): decoder} turning the raw bytes into a value. Values without a decoder are stored as bytes.
+        read_intervals: dict of {(device name, uuid): seconds} of characteristics that are read periodically instead of subscribed to.
+        history_size: number of recent samples kept per characteristic for statistics.
+        cache_file: file to persist the last known device addresses in, or None to not persist them.
+        reset_after_failures: number of consecutive failed connection attempts of a device before the Bluetooth adapter is reset.
+        min_backoff, max_backoff: range in seconds of the exponential backoff between connection attempts.
+        backend: module or object providing BleakScanner and BleakClient. Defaults to bleak.
+        stats: SensorStats to record runtime statistics in, shared with the dbus services.
+        recorder: HistoryRecorder the changed values are recorded in, or None to not keep a history.
+        loop: asyncio event loop driven by the consumers main loop, see glibasyncio.py. The client then runs on it in the
+              consumers thread, without a thread of its own and without locking. Without a loop a monitoring thread is started.
+        adapter: Bluetooth adapter to scan and connect with, e.g. 'hci1'. Defaults to the default adapter.
+        values: ValueStore shared with the clients of other adapters, see blesupervisor.py.
+        """
+        self.dispatcher = dispatcher # schedules a callable with arguments on the consumers main loop, e.g. GLib.idle_add. Listeners are called from the BLE thread if None
         self.logger = logging.getLogger(__name__) # create logger
         self.logger.info("Initializing BLE Sensor Client...")
-        self.target_device_name = target_device_name
-        self.device = None
-        self.client = None
-        self.connected_at = None
-        self.characteristic_uuids = characteristic_uuids
-        self.characteristic_values = {} # store characteristic values
+        self.backend = backend
+        self.adapter = adapter
+        self.backend_options = {'adapter': adapter} if adapter is not None else {}  # passed to BleakScanner and BleakClient
+        self.stats = stats if stats is not None else SensorStats()
+        self.recorder = recorder
+        self.device_cache = DeviceCache(cache_file)
+        self.reset_after_failures = reset_after_failures
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.decoders = decoders if decoders is not None else {}
+        self.read_intervals = read_intervals if read_intervals is not None else {}
+        self.devices = {name: SensorBLEDevice(self, name, uuids) for name, uuids in devices.items()}
+        self.values = values if values is not None else ValueStore(history_size) # decoded characteristic values by (device name, uuid), only written by the BLE thread
         self.monitor_thread = None
+        self.monitor_task = None
         self.active = False
-        self.Lock = Lock()
+        self.loop = loop
+        self.Lock = Lock() if loop is None else nullcontext()  # guards the hand over of pending values to the consumers main loop
+        self.value_listeners = []
+        self.connection_listeners = []
+        self._pending_values = {} # changed values not yet dispatched to the listeners
+        self._dispatch_scheduled = False
+        self._dispatch_scheduled_at = 0.0
+        self._reset_lock = None   # serializes Bluetooth resets between the devices, created in the monitoring loop
+        self._loop = None
+        self._stop_event = None   # set when monitoring is stopped, to wake up sleeping devices
+        self._device_tasks = {}   # monitoring task by device name
+
+    @property
+    def connected_at(self):
+        """
+        The time the longest connected device connected, or None if no device is connected.
+        """
+        connected = [device.connected_at for device in self.devices.values() if device.connected_at is not None]
+        return min(connected) if connected else None
+
+    def add_value_listener(self, listener):
+        """
+        Registers a callable that is called with a dict of {(device name, uuid): value} for every batch of changed characteristic values.
+        """
+        self.value_listeners.append(listener)
+
+    def add_connection_listener(self, listener):
+        """
+        Registers a callable that is called with (device name, connected, timestamp) for every connection state transition of a device.
+        """
+        self.connection_listeners.append(listener)
+
+    def update_devices(self, devices, decoders=None, read_intervals=None):
+        """
+        Applies a reloaded config while monitoring. Added devices are connected to and removed devices disconnected.
+        Connected devices keep their connection: only the changed characteristics are subscribed to or unsubscribed from.
+        """
+        self.decoders = decoders if decoders is not None else {}
+        self.read_intervals = read_intervals if read_intervals is not None else {}
+        current = self.devices
+        self.devices = {name: current[name] if name in current else SensorBLEDevice(self, name, uuids) for name, uuids in devices.items()}
+        added = [device for name, device in self.devices.items() if name not in current]
+        removed = [device for name, device in current.items() if name not in devices]
+        kept = [current[name] for name in devices if name in current]
+        for device in kept:
+            device.set_characteristics(devices[device.target_device_name])
+        if self._loop is not None:  # otherwise the devices are set up when monitoring starts
+            asyncio.run_coroutine_threadsafe(self._update_devices(added, removed, kept), self._loop)
+
+    async def _update_devices(self, added, removed, kept):
+        for device in removed:
+            self.logger.info("Device '%s' removed from the config", device.target_device_name)
+            device.active = False
+            task = self._device_tasks.pop(device.target_device_name, None)
+            if task is not None:
+                task.cancel()
+            await device._disconnect()
+        for device in added:
+            self.logger.info("Device '%s' added to the config", device.target_device_name)
+            self._device_tasks[device.target_device_name] = asyncio.ensure_future(device.monitor())
+        for device in kept:
+            try:
+                await device.update_characteristics()
+            except Exception as e:
+                self.logger.error("Error updating the characteristics of '%s': %s", device.target_device_name, e)
+
+    def remove_value_listener(self, listener):
+        self.value_listeners.remove(listener)
+
+    def remove_connection_listener(self, listener):
+        self.connection_listeners.remove(listener)
 
     def start_monitoring(self):
         self.logger.info("Starting BLE Sensor Client...")
-        if self.monitor_thread is not None:
+        if self.monitor_thread is not None or self.monitor_task is not None:
             self.logger.warn("Monitor thread already started. Ignoring request to start again.")
             return
+        self.active = True
+        if self.loop is not None:
+            self.monitor_task = self.loop.create_task(self._monitorAsync())
+            return
         self.monitor_thread = Thread(target=self._monitor,name="BLE Sensor Monitoring Thread", daemon=True)
         self.monitor_thread.start()
 
     def stop_monitoring(self):
         self.logger.info("Stopping BLE Sensor Client...")
+        if self.monitor_task is not None:
+            self.active = False
+            if self._stop_event is not None:
+                self._stop_event.set()
+            if self.loop.is_running():
+                self.logger.warning("Stopping from within the event loop, devices are disconnected in the background")
+            else:
+                try:
+                    self.loop.run_until_complete(self.monitor_task)  # run the loop until the devices are disconnected
+                except Exception as e:
+                    self.logger.error("Error stopping monitoring: %s", e)
+            self.monitor_task = None
+            return
         if self.monitor_thread is None:
             self.logger.warn("Monitor thread not started. Ignoring request to stop.")
             return
         self.active = False         # signal to stop monitoring
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)   # wake up devices waiting to reconnect
         self.monitor_thread.join()  # wait for thread to stop
         self.monitor_thread = None  # reset thread
 
@@ -45,100 +184,414 @@ class SensorBLEClient:
         asyncio.run(self._monitorAsync())
 
     async def _monitorAsync(self):
-        self.active = True
-        while self.active:
+        if self.backend is None:
+            import bleak   # imported on the monitoring thread, so the import runs concurrently with the dbus registration
+            self.backend = bleak
+        self._reset_lock = asyncio.Lock()
+        self._stop_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if not self.active:
+            self._stop_event.set()  # stopped before the loop existed, e.g. while bleak was imported
+        self._device_tasks ={name: asyncio.ensure_future(device.monitor()) for name, device in self.devices.items()}
+        await self._stop_event.wait()
+        await asyncio.gather(*self._device_tasks.values(), return_exceptions=True)
+        self._device_tasks = {}
+        self._loop = None
+        self.logger.info("Monitoring stopped")
+
+    async def sleep(self, delay):
+        """
+        Sleeps for the delay in seconds, or until monitoring is stopped.
+        """
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait_for(self, event, timeout):
+        """
+        Waits until the event is set, monitoring is stopped or the timeout in seconds expires.
+        """
+        tasks = [asyncio.ensure_future(event.wait()), asyncio.ensure_future(self._stop_event.wait())]
+        try:
+            await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def reset_bluetooth(self):
+        """
+        Power cycles the Bluetooth adapter. Only one device resets the adapter at a time,
+        devices waiting for the lock skip their own reset since the adapter was just reset.
+        """
+        if self._reset_lock.locked():
+            async with self._reset_lock:
+                return
+        async with self._reset_lock:
+            try:
+                self.logger.warning("Resetting Bluetooth adapter %s...", self.adapter or '')
+                if hasattr(self.backend, 'reset_adapter'):    # simulated backends reset their own adapter
+                    await self.backend.reset_adapter()
+                    return
+                for powered in (False, True):
+                    if self.adapter is None:
+                        proc = await asyncio.create_subprocess_shell('bluetoothctl power %s' % ('on' if powered else 'off'))
+                    else:   # bluetoothctl only acts on the default adapter, so power cycle this one through bluez
+                        proc = await asyncio.create_subprocess_exec('dbus-send', '--system', '--print-reply', '--dest=org.bluez', '/org/bluez/' + self.adapter,
+                                                                    'org.freedesktop.DBus.Properties.Set', 'string:org.bluez.Adapter1', 'string:Powered',
+                                                                    'variant:boolean:%s' % ('true' if powered else 'false'), stdout=asyncio.subprocess.DEVNULL)
+                    await proc.wait()
+                    await asyncio.sleep(2)
+            except Exception as e:
+                self.logger.error("Error resetting Bluetooth adapter: %s", e)
+
+    def _notification_handler(self, device_name, characteristic, data: bytearray):
+        key = (device_name, characteristic.uuid)
+        self.logger.debug("Notification received from %s for characteristic (%s): %r", device_name, characteristic.uuid, data)
+        decoder = self.decoders.get(key)
+        try:
+            value = decoder(data) if decoder is not None else bytes(data)
+        except Exception as e:
+            self.logger.error("Error decoding characteristic (%s) value %r: %s", characteristic.uuid, data, e)
+            return
+        self.stats.notification(key)
+        schedule_dispatch = False
+        try:
+            timestamp = time.time()
+            changed = self.values.put(key, value, timestamp)
+            if changed and self.recorder is not None:
+                self.recorder.record(key, timestamp, value)
+            if changed and self.value_listeners:
+                waiting = time.perf_counter()
+                with self.Lock:
+                    now = time.perf_counter()
+                    self.stats.lock_wait.record(now - waiting)
+                    self._pending_values[key] = value
+                    if not self._dispatch_scheduled:  # a dispatch already pending will pick up this value as well
+                        self._dispatch_scheduled = True
+                        self._dispatch_scheduled_at = now
+                        schedule_dispatch = True
+        except Exception as e:
+            self.logger.error("Error handling notification: %s", e)
+        if schedule_dispatch:
+            if self.dispatcher is None:
+                self._dispatch_values()
+            else:
+                self.dispatcher(self._dispatch_values)
+
+    def _dispatch_values(self):
+        with self.Lock:
+            changes = self._pending_values
+            self._pending_values = {}
+            self._dispatch_scheduled = False
+            self.stats.dispatch_delay.record(time.perf_counter() - self._dispatch_scheduled_at)
+        for listener in tuple(self.value_listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                self.logger.error("Error dispatching values to listener: %s", e)
+        return False # only run once when scheduled with GLib.idle_add
+
+    def _publish_connection(self, device_name, connected, timestamp):
+        if self.dispatcher is None:
+            self._dispatch_connection(device_name, connected, timestamp)
+        else:
+            self.dispatcher(self._dispatch_connection, device_name, connected, timestamp)
+
+    def _dispatch_connection(self, device_name, connected, timestamp):
+        for listener in tuple(self.connection_listeners):
+            try:
+                listener(device_name, connected, timestamp)
+            except Exception as e:
+                self.logger.error("Error dispatching connection state to listener: %s", e)
+        return False # only run once when scheduled with GLib.idle_add
+
+    def get_characteristic_value(self, device_name, uuid):
+        return self.values.get((device_name, uuid))
+
+    def get_characteristic_statistics(self, device_name, uuid, window, field=0):
+        """
+        Returns min, max, mean and rate of change of a field of a characteristic over the last window seconds, or None.
+        """
+        return self.values.statistics((device_name, uuid), window, field)
+
+    def is_connected(self, device_name=None):
+        """
+        Returns if the named device is connected, or if all devices are connected when no name is given.
+        """
+        if device_name is not None:
+            return self.devices[device_name].is_connected()
+        return all(device.is_connected() for device in self.devices.values())
+
+    def connected_count(self):
+        return sum(1 for device in self.devices.values() if device.is_connected())
+
+class SensorBLEDevice:
+    """
+    Connection to a single BLE server, monitored concurrently with the other devices of the SensorBLEClient.
+    Reconnects go through the states: connecting directly to the cached address, scanning for the device by name,
+    backing off, and resetting the Bluetooth adapter after too many consecutive failures.
+    While connected the monitor sleeps until bleak reports the disconnect, with a slow safety check of the link.
+    """
+    connection_check_interval = 60 # seconds between safety checks of the link, in case a disconnect callback is missed
+
+    def __init__(self, bleclient, target_device_name, characteristic_uuids):
+        self.bleclient = bleclient
+        self.logger = logging.getLogger(__name__) # create logger
+        self.target_device_name = target_device_name
+        self.device = None
+        self.client = None
+        self.connected_at = None
+        self.connected = False
+        self.active = True  # False once the device is removed from the config
+        self._read_task = None
+        self._reading = None    # ReadScheduler run by the read task
+        self._subscribed = set()    # uuids subscribed to on the current connection
+        self.set_characteristics(characteristic_uuids)
+        self.state = 'Disconnected'
+        self.failures = 0   # consecutive failed connection attempts
+        self._disconnected_event = None # set by the disconnected callback, created in the monitoring loop
+        self._disconnected_at = None    # time.perf_counter() the connection was lost, to measure the reconnect time
+
+    def set_characteristics(self, characteristic_uuids):
+        self.characteristic_uuids = characteristic_uuids
+        self.read_intervals = {uuid: interval for (name, uuid), interval in self.bleclient.read_intervals.items() if name == self.target_device_name and uuid in characteristic_uuids}
+        self.notify_uuids = [uuid for uuid in characteristic_uuids if uuid not in self.read_intervals]
+        self.read_scheduler = ReadScheduler(self.read_intervals)
+
+    async def update_characteristics(self):
+        """
+        Applies the characteristics changed with set_characteristics. While connected, the subscriptions are changed with
+        start_notify and stop_notify without disconnecting, and the polled characteristics are rescheduled.
+        """
+        if not self.connected:
+            return  # subscribed to on the next connect
+        for uuid in self._subscribed - set(self.notify_uuids):
+            self._subscribed.discard(uuid)
+            try:
+                await self.client.stop_notify(uuid)
+                self.logger.info("Unsubscribed from characteristic: %s", uuid)
+            except Exception as e:
+                self.logger.error("Error unsubscribing from characteristic %s of '%s': %s", uuid, self.target_device_name, e)
+        added = [uuid for uuid in self.notify_uuids if uuid not in self._subscribed]
+        await self._subscribe(added)
+        if self._reading is not self.read_scheduler:
+            self._start_reading()
+        self._cache_services()
+        await self._read_initial_values(added)
+
+    async def monitor(self):
+        self._disconnected_event = asyncio.Event()
+        while self.bleclient.active and self.active:
             try:
-                await self._ensure_connected()
-                await asyncio.sleep(1)  # check connection every 1 second
+                if self.connected:
+                    await self.bleclient.wait_for(self._disconnected_event, self.connection_check_interval)
+                    if self.connected and not self.client.is_connected:
+                        self.logger.warning("Lost connection to '%s' without a disconnect callback", self.target_device_name)
+                        self._set_connected(False)
+                    continue
+                self.logger.info("Client is not connected to '%s'. Attempting to connect...", self.target_device_name)
+                if await self._connect():
+                    self.failures = 0
+                    continue
+                self.failures += 1
+                # the adapter is only reset when no device is connected through it, a switched off device must not drop the others
+                if self.failures % self.bleclient.reset_after_failures == 0 and self.bleclient.connected_count() == 0:
+                    self._set_state('Resetting adapter')
+                    self.logger.error("Could not connect to device '%s' after %d attempts. Resetting Bluetooth...", self.target_device_name, self.failures)
+                    await self.bleclient.reset_bluetooth()
+                else:
+                    delay = self._backoff_delay()
+                    self._set_state('Backing off')
+                    self.logger.info("Retrying to connect to '%s' in %.1f seconds", self.target_device_name, delay)
+                    await self.bleclient.sleep(delay)
             except Exception as e:
                 self.logger.error("Error monitoring client: %s", e)
-                self.mainloop.quit()
+                await self.bleclient.sleep(self._backoff_delay())
         await self._disconnect()
-        self.logger.info("Monitoring thread stopped")
-    
+        self.logger.info("Stopped monitoring device '%s'", self.target_device_name)
+
+    def _backoff_delay(self):
+        """
+        Exponential backoff on the number of consecutive failures, with jitter so devices do not retry in lockstep.
+        """
+        delay = min(self.bleclient.max_backoff, self.bleclient.min_backoff * 2 ** max(self.failures - 1, 0))
+        return random.uniform(delay / 2, delay)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.logger.debug("Device '%s' state: %s -> %s", self.target_device_name, self.state, state)
+            self.state = state
+
     async def _connect(self):
+        address = self.bleclient.device_cache.get(self.target_device_name, 'address')
+        if address is not None:
+            self._set_state('Connecting')
+            self.logger.info("Connecting to '%s' at cached address %s...", self.target_device_name, address)
+            if await self._connect_to(address):
+                return True
+            self.logger.info("Could not connect to '%s' at cached address, scanning for it", self.target_device_name)
+        self._set_state('Scanning')
+        scan_started = time.perf_counter()
         try:
             self.logger.info("Scanning for device with name '%s'...", self.target_device_name)
-            self.device = await BleakScanner.find_device_by_name(self.target_device_name, cb=dict(use_bdaddr=False))
-            if self.device is None:
-                self.logger.warn("Could not find device")
-                return False
-            self.logger.info("Device found!")
-            self.client = BleakClient(self.device)
-            await self.client.connect()
-            self.logger.info("Connected to device!")
-            self.connected_at = datetime.now()
-
-            for characteristic in self.characteristic_uuids:
-                self.logger.info("Subscribing to characteristic: %s", characteristic)
-                await self.client.start_notify(characteristic, self._notification_handler)
+            self.device = await self.bleclient.backend.BleakScanner.find_device_by_name(self.target_device_name, cb=dict(use_bdaddr=False), **self.bleclient.backend_options)
+        except Exception as e:
+            self.logger.error("Error scanning for device '%s': %s", self.target_device_name, e)
+            self.device = None
+        self.bleclient.stats.scan_time.record(time.perf_counter() - scan_started)
+        if self.device is None:
+            self.logger.warn("Could not find device '%s'", self.target_device_name)
+            self._set_state('Disconnected')
+            return False
+        self.logger.info("Device '%s' found!", self.target_device_name)
+        self._set_state('Connecting')
+        return await self._connect_to(self.device)
+
+    async def _connect_to(self, device):
+        address = device if isinstance(device, str) else device.address
+        cached_services = self._cached_services(address)
+        try:
+            if cached_services is not None:
+                # only discover the services holding the subscribed characteristics, and reuse the services bleak discovered before
+                self.client = self.bleclient.backend.BleakClient(device, services=cached_services, timeout=self.bleclient.connect_timeout, disconnected_callback=self._on_disconnected, **self.bleclient.backend_options)
+                await self.client.connect(dangerous_use_bleak_cache=True)
+            else:
+                self.client = self.bleclient.backend.BleakClient(device, timeout=self.bleclient.connect_timeout, disconnected_callback=self._on_disconnected, **self.bleclient.backend_options)
+                await self.client.connect()
+            self.logger.info("Connected to device '%s'!", self.target_device_name)
+            self.bleclient.device_cache.set(self.target_device_name, 'address', self.client.address)
+
+            failed = await self._subscribe()
+            if failed and cached_services is not None:
+                # characteristics missing from the cached services, e.g. after a firmware update. Rediscover on the next attempt
+                self.logger.warning("Characteristics %s not found in the cached services of '%s', discovering all services on the next attempt", failed, self.target_device_name)
+                self.bleclient.device_cache.remove(self.target_device_name, 'services')
+                raise Exception("Cached services are outdated")
+            if self.notify_uuids and len(failed) == len(self.notify_uuids):
+                raise Exception("Could not subscribe to any characteristic")
+            self._cache_services()
+            self._set_state('Connected')
+            self._set_connected(True)
+            self._start_reading()
+            await self._read_initial_values()
             return True
         except Exception as e:
-            self.logger.error("Error connecting to device: %s", e)
+            self.logger.error("Error connecting to device '%s': %s", self.target_device_name, e)
+            await self._disconnect()
+            self._set_state('Disconnected')
             return False
-        
+
+    async def _subscribe(self, uuids=None):
+        """
+        Subscribes to all characteristics, or the given ones, concurrently, so one failing characteristic does not hold back the others.
+        Returns the uuids that could not be subscribed to.
+        """
+        uuids = self.notify_uuids if uuids is None else uuids
+        handler = partial(self.bleclient._notification_handler, self.target_device_name)
+        results = await asyncio.gather(*(self.client.start_notify(uuid, handler) for uuid in uuids), return_exceptions=True)
+        failed = []
+        for uuid, result in zip(uuids, results):
+            if isinstance(result, Exception):
+                self.logger.error("Error subscribing to characteristic %s of '%s': %s", uuid, self.target_device_name, result)
+                failed.append(uuid)
+            else:
+                self.logger.info("Subscribed to characteristic: %s", uuid)
+                self._subscribed.add(uuid)
+        return failed
+
+    def _start_reading(self):
+        """
+        Starts, or restarts with changed intervals, the periodic reads of the polled characteristics.
+        """
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._reading = self.read_scheduler
+        if self.read_intervals:
+            self._read_task = asyncio.ensure_future(self.read_scheduler.run(self._read_characteristic))
+
+    async def _read_initial_values(self, uuids=None):
+        """
+        Reads the current value of the readable characteristics, or the given ones, so values are available before the first notification.
+        """
+        handler = partial(self.bleclient._notification_handler, self.target_device_name)
+        async def read(characteristic):
+            try:
+                handler(characteristic, await self.client.read_gatt_char(characteristic))
+            except Exception as e:
+                self.logger.debug("Could not read initial value of characteristic %s: %s", characteristic.uuid, e)
+        characteristics = [self.client.services.get_characteristic(uuid) for uuid in (self.notify_uuids if uuids is None else uuids)]
+        await asyncio.gather(*(read(characteristic) for characteristic in characteristics if characteristic is not None and 'read' in characteristic.properties))
+
+    async def _read_characteristic(self, uuid):
+        """
+        Reads a polled characteristic and handles the value like a notification. Returns the raw value read.
+        """
+        characteristic = self.client.services.get_characteristic(uuid)
+        data = await self.client.read_gatt_char(characteristic)
+        self.bleclient._notification_handler(self.target_device_name, characteristic, data)
+        return data
+
+    def _cached_services(self, address):
+        """
+        Returns the uuids of the services holding the characteristics, if they were discovered before on the same address.
+        """
+        services = self.bleclient.device_cache.get(self.target_device_name, 'services')
+        if services is None or services.get('address') != address or set(services.get('characteristics', [])) != set(self.characteristic_uuids):
+            return None
+        return services['uuids']
+
+    def _cache_services(self):
+        uuids = set()
+        for uuid in self.characteristic_uuids:
+            characteristic = self.client.services.get_characteristic(uuid)
+            if characteristic is not None:
+                uuids.add(characteristic.service_uuid)
+        self.bleclient.device_cache.set(self.target_device_name, 'services', {'address': self.client.address, 'characteristics': sorted(self.characteristic_uuids), 'uuids': sorted(uuids)})
+
     async def _disconnect(self):
         try:
             if self.client is not None and self.client.is_connected:
-                self.logger.info("Disconnecting client...")
+                self.logger.info("Disconnecting client from '%s'...", self.target_device_name)
                 await self.client.disconnect()
-                self.connected_at = None
         except Exception as e:
             self.logger.error("Error disconnecting client: %s", e)
-        
-    def _notification_handler(self, characteristic: BleakGATTCharacteristic, data: bytearray):
-        try:
-            self.Lock.acquire()
-            self.logger.debug("Notification received for characteristic (%s): %r", characteristic.uuid, data)
-            self.characteristic_values[characteristic.uuid] = data
-        except Exception as e:
-            self.logger.error("Error handling notification: %s", e)
-        finally:
-            if self.Lock.locked():
-                self.Lock.release()
-        
-    async def _ensure_connected(self):
-        try:
-            if self.is_connected():
-                return
-            self.logger.info("Client is not connected. Attempting to connect...")
-            if(await self._connect()):
-                return
-            self.logger.error("Could not connect to device. Resetting Bluetooth...")
-            subprocess.run('bluetoothctl power off', shell=True, check=True)
-            # check_call("bluetoothctl power off")
-            await asyncio.sleep(2)
-            # check_call("bluetoothctl power on")
-            subprocess.run('bluetoothctl power on', shell=True, check=True)
-            await asyncio.sleep(2)
-            logging.info("Trying to re-connect after Bluetooth reset")
-            if(await self._connect()):
-                self.logger.info("Connected to device")
-                return
-            logging.error("Could not connect to device after Bluetooth reset. Exiting driver...")
-            raise Exception("Could not connect to device")  # Rasing exception to stop the main loop
-        except Exception as e:
-            self.logger.error("Error ensuring connection: %s", e)
-            self.mainloop.quit()
+        self._set_connected(False)
 
-    def get_characteristic_value(self, uuid):
-        try:
-            self.Lock.acquire()
-            if uuid in self.characteristic_values:
-                return self.characteristic_values[uuid]
-            return None
-        except Exception as e:
-            self.logger.error("Error getting characteristic value: %s", e)
-        finally:
-            if self.Lock.locked():
-                self.Lock.release()
+    def _on_disconnected(self, client):
+        if client is not self.client:
+            return  # a previous client that was replaced by a new connection attempt
+        self.logger.info("Disconnected from device '%s'", self.target_device_name)
+        self._set_state('Disconnected')
+        self._set_connected(False)
+
+    def _set_connected(self, connected):
+        """
+        Tracks the connection state and publishes it to the connection listeners when it changes.
+        """
+        if connected == self.connected:
+            return
+        timestamp = datetime.now()
+        self.connected = connected
+        if not connected:
+            self._disconnected_at = time.perf_counter()
+        elif self._disconnected_at is not None:
+            self.bleclient.stats.reconnect(self.target_device_name, time.perf_counter() - self._disconnected_at)
+        if not connected:
+            self._subscribed.clear()
+        if not connected and self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self.connected_at = timestamp if connected else None
+        if not connected and self._disconnected_event is not None:
+            self._disconnected_event.set()
+        elif self._disconnected_event is not None:
+            self._disconnected_event.clear()
+        self.bleclient._publish_connection(self.target_device_name, connected, timestamp)
 
     def is_connected(self):
-        is_connected = self.client is not None and self.client.is_connected
-        if not is_connected:
-            self.logger.debug("Client is not connected")
-            self.connected_at = None
-        return is_connected
-    
+        return self.connected
+
 class DeviceNotFoundError(Exception):
-    pass
\ No newline at end of file
+    pass
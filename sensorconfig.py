@@ -0,0 +1,155 @@
+"""
+Indexes the sensor config at load time into the tables the driver works with:
+the characteristics to subscribe to per device, a record decoder per characteristic,
+and the dbus service paths each field of a characteristic is published to.
+
+The config can be loaded from a json file with load_config, e.g.
+    {"target_device_name": "ESP32 BLE Sensor Server", "sensors": [{"Type": "tank", "DeviceInstance": 5350, "Paths": {...}}]}
+It is validated completely before it is used, so an invalid file never replaces a running config.
+"""
+import json
+from sensordecoders import compile_record_decoder
+from sensorfilters import compile_record_filter
+from derivedpaths import DerivedPaths
+from publishpolicy import PublishPolicy
+
+path_keys = {'initial', 'BLE_Char_UUID', 'Device', 'Format', 'Read_Interval', 'Filter', 'Publish', 'Derived'}
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _validate_format(format):
+    """
+    Raises a ValueError if a Format has a value of the wrong type, which would otherwise fail on every notification.
+    """
+    if not isinstance(format, dict):
+        raise ValueError("a Format must be a dict, not %r" % (format,))
+    if not isinstance(format.get('struct', '<d'), str):
+        raise ValueError("struct must be a string")
+    if not isinstance(format.get('byte_offset', 0), int) or isinstance(format.get('byte_offset', 0), bool) or format.get('byte_offset', 0) < 0:
+        raise ValueError("byte_offset must be an integer of at least 0")
+    for key in ('scale', 'offset'):
+        if not _number(format.get(key, 0)):
+            raise ValueError("%s must be a number, not %r" % (key, format[key]))
+    if format.get('round') is not None and (not isinstance(format['round'], int) or isinstance(format['round'], bool)):
+        raise ValueError("round must be an integer number of decimals, not %r" % (format['round'],))
+
+def characteristic_device(sensor, settings, default_device):
+    """
+    Returns the name of the BLE server device the characteristic of a path belongs to.
+    """
+    return settings.get("Device", sensor.get("Device", default_device))
+
+def service_name(sensor):
+    return 'com.victronenergy.'+ str(sensor["Type"]) + '.ble_' + str(sensor["Type"]) + '_sensor_' + str(sensor["DeviceInstance"])
+
+class CharacteristicTable:
+    def __init__(self, sensors, default_device):
+        self.devices = {}   # characteristic uuids to subscribe to, by device name
+        self.decoders = {}  # record decoders, including the filters of the paths, by (device name, uuid)
+        self.routes = {}    # [(service name, path, field index)] to publish to, by (device name, uuid)
+        self.fields = {}    # ((device name, uuid), field index) read by a path, by (service name, path)
+        self.read_intervals = {}  # seconds between reads of characteristics that are polled instead of notifying, by (device name, uuid)
+        self.formats = {}   # [(Format, Filter)] of the paths reading a characteristic, to tell whether its decoder changed, by (device name, uuid)
+
+        formats = {}
+        filters = {}
+        readers = {}
+        for sensor in sensors:
+            servicename = service_name(sensor)
+            for path, settings in sensor["Paths"].items():
+                if "BLE_Char_UUID" not in settings:
+                    continue
+                key = (characteristic_device(sensor, settings, default_device), settings["BLE_Char_UUID"])
+                if key not in formats:
+                    self.devices.setdefault(key[0], []).append(key[1])
+                formats.setdefault(key, []).append(settings.get("Format"))
+                filters.setdefault(key, []).append(settings.get("Filter"))
+                if "Read_Interval" in settings:
+                    self.read_intervals[key] = min(settings["Read_Interval"], self.read_intervals.get(key, settings["Read_Interval"]))
+                readers.setdefault(key, []).append((servicename, path))
+
+        for key, key_formats in formats.items():
+            try:
+                self.decoders[key], positions = compile_record_decoder(key_formats)
+            except Exception as e:
+                raise ValueError("Invalid Format for characteristic %s of device '%s': %s" % (key[1], key[0], e))
+            try:
+                record_filter, positions = compile_record_filter(positions, filters[key])
+            except Exception as e:
+                raise ValueError("Invalid Filter for characteristic %s of device '%s': %s" % (key[1], key[0], e))
+            if record_filter is not None:
+                self.decoders[key] = _filtered(self.decoders[key], record_filter)
+            self.formats[key] = list(zip(key_formats, filters[key]))
+            self.routes[key] = []
+            for (servicename, path), index in zip(readers[key], positions):
+                self.routes[key].append((servicename, path, index))
+                self.fields[(servicename, path)] = (key, index)
+
+    def route(self, changes):
+        """
+        Fans a batch of changed characteristic records out to the paths reading from them.
+        Returns a dict of {service name: {path: value}}.
+        """
+        updates = {}
+        for key, record in changes.items():
+            for servicename, path, index in self.routes.get(key, ()):
+                if index < len(record):     # a record decoded before the config was reloaded may have fewer fields
+                    updates.setdefault(servicename, {})[path] = record[index]
+        return updates
+
+def _filtered(decoder, record_filter):
+    return lambda data: record_filter(decoder(data))
+
+def load_config(filename):
+    """
+    Reads and validates a config file. Returns the default device name, the sensors and their CharacteristicTable.
+    """
+    with open(filename) as f:
+        config = json.load(f)
+    if not isinstance(config, dict) or not isinstance(config.get("sensors"), list):
+        raise ValueError("%s needs a list of sensors" % filename)
+    default_device = config.get("target_device_name")
+    if not isinstance(default_device, str):
+        raise ValueError("%s needs the target_device_name of the default BLE server device" % filename)
+    return default_device, config["sensors"], validate_sensors(config["sensors"], default_device)
+
+def validate_sensors(sensors, default_device):
+    """
+    Checks the sensors, compiling their formats, filters, derived paths and publish policies. Returns their CharacteristicTable.
+    """
+    servicenames = set()
+    for sensor in sensors:
+        if not isinstance(sensor, dict) or not isinstance(sensor.get("Type"), str) or not isinstance(sensor.get("DeviceInstance"), int) or not isinstance(sensor.get("Paths"), dict):
+            raise ValueError("Every sensor needs a Type, an integer DeviceInstance and Paths: %r" % (sensor,))
+        servicename = service_name(sensor)
+        if servicename in servicenames:
+            raise ValueError("Sensor %s is configured twice" % servicename)
+        servicenames.add(servicename)
+        if not isinstance(sensor.get("Device", ""), str):
+            raise ValueError("Device of %s must be the name of a BLE server device" % servicename)
+        for path, settings in sensor["Paths"].items():
+            if not path.startswith('/') or not isinstance(settings, dict) or 'initial' not in settings:
+                raise ValueError("Path %s of %s needs to start with / and have an initial value" % (path, servicename))
+            unknown = set(settings) - path_keys
+            if unknown:
+                raise ValueError("Unknown settings %s on path %s of %s" % (', '.join(sorted(unknown)), path, servicename))
+            if not isinstance(settings.get("Device", ""), str):
+                raise ValueError("Device on path %s of %s must be the name of a BLE server device" % (path, servicename))
+            if 'Read_Interval' in settings and (not _number(settings['Read_Interval']) or settings['Read_Interval'] <= 0):
+                raise ValueError("Read_Interval on path %s of %s must be a positive number of seconds" % (path, servicename))
+            if settings.get('Format') is not None:
+                try:
+                    _validate_format(settings['Format'])
+                except ValueError as e:
+                    raise ValueError("Invalid Format on path %s of %s: %s" % (path, servicename, e))
+            if 'Publish' in settings:
+                try:
+                    PublishPolicy(**settings['Publish'])
+                except (TypeError, ValueError) as e:
+                    raise ValueError("Invalid Publish on path %s of %s: %s" % (path, servicename, e))
+        try:
+            DerivedPaths(sensor["Paths"])
+        except Exception as e:
+            raise ValueError("Invalid Derived path of %s: %s" % (servicename, e))
+    return CharacteristicTable(sensors, default_device)
@@ -0,0 +1,96 @@
+"""
+Decoders that turn the raw bytes of a BLE characteristic into numbers.
+The format of each path is declared in the sensor config and compiled once at startup into a decoder using a cached
+struct.Struct, so no format guessing is done when a value is received.
+
+A characteristic can carry a packed record of many readings. Every path reading from the same characteristic declares
+where its reading is in the record with byte_offset, and all of them are decoded with a single unpack per notification.
+Decoders always return a tuple with one value per field of the record.
+
+Format keys:
+    struct:      struct format of the value, e.g. '<h' for a little endian int16 or '<f' for a float32
+    byte_offset: position of the value in a packed record (default 0)
+    scale:       factor the raw value is multiplied with (default 1)
+    offset:      added to the scaled value (default 0)
+    round:       number of decimals to round the result to (default no rounding)
+"""
+import struct
+
+_byteorders = '<>!=@'
+
+def compile_record_decoder(formats):
+    """
+    Compiles the formats of all paths reading from one characteristic into a single decoder.
+    Returns the decoder, which returns a tuple of values, and the position in that tuple of the value of each format.
+    """
+    if formats == [None]:
+        return _decode_legacy_record, [0]
+    if None in formats:
+        raise ValueError("Every path reading from a packed characteristic needs a Format")
+    fields = sorted(set(_field(format) for format in formats), key=_field_order)
+    positions = [fields.index(_field(format)) for format in formats]
+    converters = [_converter(scale, offset, digits) for byte_offset, fmt, scale, offset, digits in fields]
+    unpack = _record_struct(fields)
+    if unpack is None:  # fields that can not be described by one struct, e.g. overlapping or mixed byte orders
+        unpacks = [(struct.Struct(fmt).unpack_from, byte_offset) for byte_offset, fmt, scale, offset, digits in fields]
+        unpack = lambda data: tuple(unpack_field(data, byte_offset)[0] for unpack_field, byte_offset in unpacks)
+    if all(convert is None for convert in converters):
+        return unpack, positions
+    converters = [convert if convert is not None else _identity for convert in converters]
+    return lambda data: tuple(convert(value) for convert, value in zip(converters, unpack(data))), positions
+
+def _field(format):
+    fmt = format.get('struct', '<d')
+    if fmt[0] not in _byteorders:
+        fmt = '=' + fmt     # native byte order with standard sizes and no alignment, so byte_offset is exact
+    return (format.get('byte_offset', 0), fmt, format.get('scale', 1), format.get('offset', 0), format.get('round'))
+
+def _field_order(field):
+    byte_offset, fmt, scale, offset, digits = field
+    return (byte_offset, fmt, scale, offset, digits if digits is not None else -1)
+
+def _record_struct(fields):
+    """
+    Returns the unpack function of one struct covering all fields, with padding between them, or None if that is not possible.
+    """
+    byteorder = fields[0][1][0]
+    if byteorder == '@':
+        return None     # native alignment would insert padding the byte offsets do not account for
+    record = byteorder
+    position = 0
+    for byte_offset, fmt, scale, offset, digits in fields:
+        code = fmt[1:]
+        if fmt[0] != byteorder or len(code) != 1 or byte_offset < position:
+            return None
+        record += 'x' * (byte_offset - position) + code
+        position = byte_offset + struct.calcsize(byteorder + code)
+    return struct.Struct(record).unpack_from
+
+def _converter(scale, offset, digits):
+    """
+    Returns the simplest function applying the scale, offset and rounding, or None if the value is used as is.
+    """
+    if scale == 1 and offset == 0:
+        if digits is None:
+            return None
+        return lambda value: round(value, digits)
+    if digits is None:
+        return lambda value: value * scale + offset
+    return lambda value: round(value * scale + offset, digits)
+
+def _identity(value):
+    return value
+
+_double = struct.Struct('<d').unpack_from
+
+def decode_legacy(data):
+    """
+    Decoding used before formats were declared: a double rounded to 1 decimal if the value has 8 bytes or more,
+    otherwise an unsigned little endian integer.
+    """
+    if len(data) >= 8:
+        return round(_double(data)[0], 1)
+    return int.from_bytes(data, byteorder='little')
+
+def _decode_legacy_record(data):
+    return (decode_legacy(data),)
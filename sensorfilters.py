@@ -0,0 +1,174 @@
+"""
+Streaming filters smoothing noisy readings, e.g. a sloshing tank level or a jittering temperature, before they are published.
+They run on the BLE thread right after decoding, so a reading the filters do not change causes no dispatch at all.
+
+The filters of a path are declared with "Filter" in the sensor config, as a list of stages applied in order, e.g.
+    'Filter': [{'type': 'outlier', 'window': 9}, {'type': 'median', 'window': 5}, {'type': 'ema', 'time_constant': 30}, {'type': 'round', 'digits': 1}]
+
+Stages:
+    outlier: drops readings deviating from the median of the last window readings by more than threshold times their
+             median absolute deviation, and at least max_deviation. A lasting change passes once it fills half the window.
+             window (default 9), threshold (default 3), max_deviation (default 0)
+    median:  median of the last window readings. window (default 5)
+    ema:     exponential moving average, weighting each reading with alpha, or by the time since the previous reading
+             with time_constant in seconds
+    round:   rounds to digits decimals (default 0), so changes below the resolution are not published
+
+Each stage keeps its state in a preallocated array of at most window readings.
+"""
+import json
+import math
+import time
+from array import array
+from bisect import bisect_left, insort
+
+class SortedWindow:
+    """
+    The last size readings, in arrival order and sorted.
+    """
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("window must be at least 1")
+        self.size = size
+        self.count = 0
+        self._ring = array('d', bytes(8 * size))
+        self._sorted = array('d')
+        self._index = 0
+
+    def append(self, value):
+        if self.count == self.size:
+            del self._sorted[bisect_left(self._sorted, self._ring[self._index])]
+        else:
+            self.count += 1
+        self._ring[self._index] = value
+        self._index = (self._index + 1) % self.size
+        insort(self._sorted, value)
+
+    def median(self):
+        middle = self.count // 2
+        if self.count % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+    def deviation(self, median):
+        """
+        Returns the median absolute deviation from the median.
+        """
+        deviations = sorted(abs(value - median) for value in self._sorted)
+        middle = self.count // 2
+        if self.count % 2:
+            return deviations[middle]
+        return (deviations[middle - 1] + deviations[middle]) / 2
+
+class MovingMedian:
+    def __init__(self, window=5):
+        self._window = SortedWindow(window)
+
+    def __call__(self, value):
+        self._window.append(value)
+        return self._window.median()
+
+class OutlierRejection:
+    """
+    Hampel filter. Rejected readings return None.
+    """
+    min_count = 3   # readings needed before anything is rejected
+
+    def __init__(self, window=9, threshold=3, max_deviation=0):
+        self._window = SortedWindow(window)
+        self.threshold = threshold * 1.4826   # scales the median absolute deviation to a standard deviation
+        self.max_deviation = max_deviation
+
+    def __call__(self, value):
+        window = self._window
+        if window.count >= self.min_count:
+            median = window.median()
+            limit = max(self.max_deviation, self.threshold * window.deviation(median))
+            window.append(value)
+            if abs(value - median) > limit:
+                return None
+            return value
+        window.append(value)
+        return value
+
+class ExponentialMovingAverage:
+    def __init__(self, alpha=None, time_constant=None):
+        if (alpha is None) == (time_constant is None):
+            raise ValueError("ema needs either alpha or time_constant")
+        if alpha is not None and not 0 < alpha <= 1:
+            raise ValueError("alpha must be between 0 and 1")
+        self.alpha = alpha
+        self.time_constant = time_constant
+        self._average = None
+        self._time = None
+
+    def __call__(self, value):
+        if self._average is None:
+            self._average = value
+        else:
+            alpha = self.alpha
+            if alpha is None:
+                now = time.monotonic()
+                alpha = 1 - math.exp(-(now - self._time) / self.time_constant)
+            self._average += alpha * (value - self._average)
+        if self.alpha is None:
+            self._time = time.monotonic()
+        return self._average
+
+class Round:
+    def __init__(self, digits=0):
+        self.digits = digits
+
+    def __call__(self, value):
+        return round(value, self.digits)
+
+filter_types = {
+    'outlier': OutlierRejection,
+    'median': MovingMedian,
+    'ema': ExponentialMovingAverage,
+    'round': Round,
+}
+
+class FilterChain:
+    """
+    Runs a reading through the stages of a path. When a stage drops the reading, the previous output is returned.
+    """
+    def __init__(self, stages):
+        self._stages = []
+        for stage in stages:
+            settings = dict(stage)
+            type = settings.pop('type', None)
+            if type not in filter_types:
+                raise ValueError("Unknown filter type %r" % type)
+            self._stages.append(filter_types[type](**settings))
+        self._output = None
+
+    def __call__(self, value):
+        for stage in self._stages:
+            value = stage(value)
+            if value is None:
+                return self._output
+        self._output = value
+        return value
+
+def compile_record_filter(positions, filters):
+    """
+    Compiles the filters of all paths reading from one characteristic into a single function applied to each decoded record.
+    positions are the fields of the record the paths read, filters their "Filter" config or None.
+    Paths reading the same field through different filters each get their own field in the filtered record.
+    Returns the function, or None if no path is filtered, and the position of each path in the filtered record.
+    """
+    if all(not stages for stages in filters):
+        return None, positions
+    columns = []
+    stages_of = {}
+    for position, stages in zip(positions, filters):
+        column = (position, json.dumps(stages, sort_keys=True) if stages else None)
+        if column not in stages_of:
+            columns.append(column)
+            stages_of[column] = stages
+    chains = [(position, FilterChain(stages_of[(position, key)]) if key is not None else None) for position, key in columns]
+    new_positions = [columns.index((position, json.dumps(stages, sort_keys=True) if stages else None)) for position, stages in zip(positions, filters)]
+    def apply(record):
+        return tuple(chain(record[position]) if chain is not None else record[position] for position, chain in chains)
+    return apply, new_positions
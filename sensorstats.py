@@ -0,0 +1,153 @@
+"""
+Low overhead runtime statistics of the BLE Sensor Client, published on com.victronenergy.BLESensorClient under /Stats.
+Recording is a counter increment or a bucket increment in a fixed histogram, so it can stay enabled permanently.
+Rates and windowed histograms are computed by tick(), which the client service calls periodically.
+Statistics are recorded from both the BLE thread and the main loop without locking; a sample recorded while
+tick() runs may be counted in the next window instead, which is fine for statistics.
+"""
+from array import array
+from bisect import bisect_left
+import time
+
+class Histogram:
+    """
+    Histogram of durations with fixed buckets in milliseconds.
+    """
+    bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self):
+        self.counts = array('L', [0] * (len(self.bounds) + 1))
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        """
+        Upper bound in milliseconds of the bucket holding the percentile, or the maximum for the last bucket.
+        """
+        if self.count == 0:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else round(self.max, 1)
+        return round(self.max, 1)
+
+    def summary(self):
+        return {'count': self.count, 'p50': self.percentile(0.5), 'p90': self.percentile(0.9), 'p99': self.percentile(0.99), 'max': round(self.max, 1)}
+
+    def text(self):
+        """
+        Non empty buckets as text, e.g. '<=1ms:120 <=2ms:3 >10000ms:1'.
+        """
+        parts = []
+        for index, count in enumerate(self.counts):
+            if count:
+                parts.append(('<=%dms:%d' % (self.bounds[index], count)) if index < len(self.bounds) else ('>%dms:%d' % (self.bounds[-1], count)))
+        return ' '.join(parts)
+
+class WindowedHistogram:
+    """
+    Histogram of the current window, the last completed window and the total since start.
+    """
+    def __init__(self):
+        self.current = Histogram()
+        self.last = Histogram()
+        self.total = Histogram()
+
+    def record(self, seconds):
+        self.current.record(seconds)
+
+    def tick(self):
+        current, self.current = self.current, Histogram()
+        self.total.merge(current)
+        self.last = current
+
+class SensorStats:
+    def __init__(self):
+        self.started = time.time()
+        self.notifications = {}     # notifications received by (device name, uuid)
+        self.notification_rates = {}  # notifications per second in the last window by (device name, uuid)
+        self.dbus_writes = 0
+        self.dbus_writes_per_second = 0.0
+        self.dbus_suppressed = 0    # updates held back by the publish policies
+        self.publish_latency = WindowedHistogram()  # from receiving a notification to publishing it on dbus
+        self.dispatch_delay = WindowedHistogram()   # from scheduling a dispatch to the main loop running it
+        self.lock_wait = WindowedHistogram()        # waiting for the lock guarding the hand over to the main loop
+        self.scan_time = WindowedHistogram()
+        self.reconnects = {}        # {'count', 'last', 'total'} reconnect durations in seconds and 'at', the time.time() of the last one, by device name
+        self._last_tick = time.time()
+        self._last_notifications = {}
+        self._last_dbus_writes = 0
+
+    def notification(self, key):
+        self.notifications[key] = self.notifications.get(key, 0) + 1
+
+    def dbus_write(self):
+        self.dbus_writes += 1
+
+    def dbus_suppress(self):
+        self.dbus_suppressed += 1
+
+    def reconnect(self, device_name, seconds):
+        reconnects = self.reconnects.setdefault(device_name, {'count': 0, 'last': 0.0, 'total': 0.0, 'at': 0.0})
+        reconnects['count'] += 1
+        reconnects['last'] = seconds
+        reconnects['at'] = time.time()
+        reconnects['total'] += seconds
+
+    def tick(self):
+        """
+        Closes the current window: computes the rates and rolls over the windowed histograms.
+        """
+        now = time.time()
+        elapsed = max(now - self._last_tick, 1e-6)
+        notifications = dict(self.notifications)
+        self.notification_rates = {key: (count - self._last_notifications.get(key, 0)) / elapsed for key, count in notifications.items()}
+        self._last_notifications = notifications
+        dbus_writes = self.dbus_writes
+        self.dbus_writes_per_second = (dbus_writes - self._last_dbus_writes) / elapsed
+        self._last_dbus_writes = dbus_writes
+        for histogram in (self.publish_latency, self.dispatch_delay, self.lock_wait, self.scan_time):
+            histogram.tick()
+        self._last_tick = now
+
+    def snapshot(self, values=None):
+        """
+        All statistics as a dict. The age of the last value of each characteristic is included when the ValueStore is given.
+        """
+        now = time.time()
+        characteristics = {}
+        for key, count in self.notifications.items():
+            sample = values.get_sample(key) if values is not None else None
+            characteristics['%s/%s' % key] = {
+                'notifications': count,
+                'notifications_per_second': round(self.notification_rates.get(key, 0.0), 2),
+                'value_age': round(now - sample[0], 1) if sample is not None else None,
+            }
+        return {
+            'uptime': round(now - self.started),
+            'characteristics': characteristics,
+            'dbus_writes': self.dbus_writes,
+            'dbus_writes_per_second': round(self.dbus_writes_per_second, 2),
+            'dbus_suppressed': self.dbus_suppressed,
+            'publish_latency_ms': dict(self.publish_latency.total.summary(), buckets=self.publish_latency.total.text()),
+            'dispatch_delay_ms': dict(self.dispatch_delay.total.summary(), buckets=self.dispatch_delay.total.text()),
+            'lock_wait_ms': self.lock_wait.total.summary(),
+            'scan_time_ms': self.scan_time.total.summary(),
+            'reconnects': {name: dict(reconnects, mean=reconnects['total'] / reconnects['count']) for name, reconnects in self.reconnects.items()},
+        }
@@ -0,0 +1,50 @@
+"""
+Timing trace of the startup of the driver, to see which phase is slow.
+Each phase is timed from the end of the previous one, and events like the first connection are timed from the start.
+The time the interpreter needed before the trace was created is taken from the process start time in /proc.
+"""
+import logging
+import os
+import resource
+import time
+
+def process_age():
+    """
+    Returns the seconds since the process was started, or None if unknown.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            started = int(f.read().rsplit(')', 1)[1].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0]) - started
+    except Exception:
+        return None
+
+class StartupTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []    # (name, seconds)
+        age = process_age()
+        if age is not None:
+            self.phases.append(('interpreter', age))
+        self._last = self.started
+
+    def phase(self, name):
+        """
+        Ends a phase of the startup.
+        """
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def event(self, name):
+        """
+        Logs the time since the start of an event after startup, e.g. the first connection.
+        """
+        logging.info("Startup: %s after %.0f ms", name, (time.perf_counter() - self.started) * 1000)
+
+    def log(self):
+        total = sum(seconds for name, seconds in self.phases)
+        logging.info("Startup in %.0f ms: %s, max RSS %.1f MB", total * 1000,
+                     ', '.join("%s %.0f ms" % (name, seconds * 1000) for name, seconds in self.phases),
+                     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3)
@@ -0,0 +1,42 @@
+import struct
+import unittest
+from sensordecoders import compile_record_decoder
+
+class CompileRecordDecoderTest(unittest.TestCase):
+    def test_packed_record_without_byte_order(self):
+        decode, positions = compile_record_decoder([{'struct': 'B', 'byte_offset': 0}, {'struct': 'h', 'byte_offset': 1}])
+        record = decode(bytes([7]) + struct.pack('=h', 300) + bytes(1))
+        self.assertEqual([record[position] for position in positions], [7, 300])
+
+    def test_packed_record_with_native_alignment(self):
+        decode, positions = compile_record_decoder([{'struct': '@B', 'byte_offset': 0}, {'struct': '@h', 'byte_offset': 1}])
+        record = decode(bytes([7]) + struct.pack('=h', 300) + bytes(1))
+        self.assertEqual([record[position] for position in positions], [7, 300])
+
+    def test_packed_record_with_gap(self):
+        decode, positions = compile_record_decoder([{'struct': '<h', 'byte_offset': 4, 'scale': 0.1}, {'struct': '<B', 'byte_offset': 0}])
+        record = decode(bytes([5, 0, 0, 0]) + struct.pack('<h', 215))
+        self.assertEqual([record[position] for position in positions], [21.5, 5])
+
+    def test_same_field_with_and_without_rounding(self):
+        decode, positions = compile_record_decoder([{'struct': '<f'}, {'struct': '<f', 'round': 1}])
+        record = decode(struct.pack('<f', 21.46))
+        self.assertAlmostEqual(record[positions[0]], 21.46, places=5)
+        self.assertEqual(record[positions[1]], 21.5)
+
+    def test_shared_field_is_decoded_once(self):
+        decode, positions = compile_record_decoder([{'struct': '<h'}, {'struct': '<h'}])
+        self.assertEqual(positions, [0, 0])
+        self.assertEqual(decode(struct.pack('<h', -3)), (-3,))
+
+    def test_legacy_formats(self):
+        decode, positions = compile_record_decoder([None])
+        self.assertEqual(decode(struct.pack('<d', 12.34)), (12.3,))
+        self.assertEqual(decode(bytes([1, 2])), (513,))
+
+    def test_missing_format_of_packed_characteristic(self):
+        with self.assertRaises(ValueError):
+            compile_record_decoder([None, {'struct': '<h'}])
+
+if __name__ == "__main__":
+    unittest.main()
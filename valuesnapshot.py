@@ -0,0 +1,74 @@
+"""
+Persistent snapshot of the latest decoded value of every characteristic, with the time it was received.
+On startup the sensor services are seeded from it, so a restart does not publish the initial values, like an empty tank,
+until the BLE server devices are connected again.
+
+Values are written behind: changes are collected in memory and written at most once every interval seconds,
+so a busy sensor does not wear out the SD card.
+"""
+import json
+import logging
+import os
+import time
+from atomicwrite import atomic_write_json
+
+class ValueSnapshot:
+    """
+    schedule is called with (delay in seconds, callback) to run a callback later on the main loop.
+    """
+    def __init__(self, filename, schedule, interval=300):
+        self.logger = logging.getLogger(__name__) # create logger
+        self.filename = filename
+        self.interval = interval
+        self._schedule = schedule
+        self._records = {}      # (timestamp, record) by (device name, uuid)
+        self._scheduled = False
+        self._written_at = time.monotonic()  # time.monotonic() of the last write, the first batch is written an interval after startup
+        self.writes = 0
+
+    def load(self, max_age=None):
+        """
+        Reads the snapshot. Returns the records not older than max_age seconds by (device name, uuid), with their timestamp.
+        """
+        if self.filename is None or not os.path.exists(self.filename):
+            return {}
+        try:
+            with open(self.filename) as f:
+                entries = json.load(f)["values"]
+        except Exception as e:
+            self.logger.warning("Could not read value snapshot %s: %s", self.filename, e)
+            return {}
+        now = time.time()
+        for entry in entries:
+            if max_age is None or now - entry["timestamp"] <= max_age:
+                self._records[(entry["device"], entry["uuid"])] = (entry["timestamp"], tuple(entry["record"]))
+        return dict(self._records)
+
+    def update(self, key, timestamp, record):
+        """
+        Records the latest value of a characteristic, to be written with the next batch.
+        """
+        if not isinstance(record, tuple):
+            return  # undecoded bytes are not kept
+        if self._records.get(key) == (timestamp, record):
+            return
+        self._records[key] = (timestamp, record)
+        if not self._scheduled:
+            self._scheduled = True
+            self._schedule(max(0, self.interval - (time.monotonic() - self._written_at)), self._write_scheduled)
+
+    def _write_scheduled(self):
+        self._scheduled = False
+        self.write()
+        return False    # run once
+
+    def write(self):
+        if self.filename is None:
+            return
+        entries = [{"device": key[0], "uuid": key[1], "timestamp": timestamp, "record": list(record)} for key, (timestamp, record) in self._records.items()]
+        try:
+            atomic_write_json(self.filename, {"values": entries})
+            self.writes += 1
+        except Exception as e:
+            self.logger.warning("Could not write value snapshot %s: %s", self.filename, e)
+        self._written_at = time.monotonic()
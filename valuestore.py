@@ -0,0 +1,112 @@
+"""
+Store of the decoded characteristic values of the BLE client.
+
+The latest (timestamp, value) per characteristic is kept in a dict that is only written by the BLE thread.
+Replacing an entry is a single dict assignment, which is atomic in CPython, so readers never take a lock.
+Next to it each characteristic has a bounded ring buffer of recent samples, backed by preallocated arrays,
+so memory stays fixed regardless of how long the driver runs. Windowed statistics are computed on slices
+of those arrays instead of Python lists.
+"""
+from array import array
+from bisect import bisect_left
+import time
+
+class ValueStore:
+    def __init__(self, history_size=256):
+        self.history_size = history_size
+        self._latest = {}   # (timestamp, value) by key
+        self._history = {}  # RingBuffer by key, for values that are records of numbers
+
+    def put(self, key, value, timestamp=None):
+        """
+        Stores a value. Returns True if it differs from the previous value.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        previous = self._latest.get(key)
+        self._latest[key] = (timestamp, value)
+        if isinstance(value, tuple):
+            history = self._history.get(key)
+            if history is None or history.width != len(value):
+                history = self._history[key] = RingBuffer(self.history_size, len(value))
+            history.append(timestamp, value)
+        return previous is None or previous[1] != value
+
+    def get(self, key):
+        """
+        Returns the latest value, or None if no value was stored yet.
+        """
+        sample = self._latest.get(key)
+        return sample[1] if sample is not None else None
+
+    def get_sample(self, key):
+        """
+        Returns the latest (timestamp, value), or None if no value was stored yet.
+        """
+        return self._latest.get(key)
+
+    def keys(self):
+        return list(self._latest.keys())
+
+    def statistics(self, key, window, field=0):
+        """
+        Returns min, max, mean and rate of change per second of a field over the last window seconds,
+        or None if there are no samples in the window.
+        """
+        history = self._history.get(key)
+        if history is None:
+            return None
+        return history.statistics(time.time() - window, field)
+
+class RingBuffer:
+    """
+    Fixed size buffer of (timestamp, record) samples, with an array per field of the record.
+    """
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = [array('d', bytes(8 * capacity)) for field in range(width)]
+        self.count = 0
+        self.head = 0   # index the next sample is written to, which is the oldest sample once the buffer is full
+
+    def append(self, timestamp, record):
+        head = self.head
+        self.timestamps[head] = timestamp
+        for values, value in zip(self.values, record):
+            values[head] = value
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _segments(self, since):
+        """
+        Index ranges of the samples not older than since, oldest first. Each range is sorted by time.
+        """
+        if self.count < self.capacity:
+            ranges = [(0, self.count)]
+        else:
+            ranges = [(self.head, self.capacity), (0, self.head)]
+        segments = []
+        for start, end in ranges:
+            start = bisect_left(self.timestamps, since, start, end)
+            if start < end:
+                segments.append((start, end))
+        return segments
+
+    def statistics(self, since, field=0):
+        segments = self._segments(since)
+        if not segments:
+            return None
+        values = self.values[field]
+        slices = [values[start:end] for start, end in segments]
+        count = sum(len(part) for part in slices)
+        first = segments[0][0]
+        last = segments[-1][1] - 1
+        duration = self.timestamps[last] - self.timestamps[first]
+        return {
+            'count': count,
+            'min': min(min(part) for part in slices),
+            'max': max(max(part) for part in slices),
+            'mean': sum(sum(part) for part in slices) / count,
+            'rate': (values[last] - values[first]) / duration if duration > 0 else 0.0,
+        }